@@ -0,0 +1,72 @@
+"""
+Compares the EmailParser backends on a synthetic corpus.
+
+    python -m benchmarks.bench_parser [--count 200] [--repeat 3] [--dir path/to/html]
+
+Reports throughput (emails/s and MB/s), peak traced memory per email and how
+many outputs differ from the 'soup' backend. tracemalloc only sees Python
+allocations, so the lxml peak leaves out what its C parser allocates.
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from src.utils.parser import EmailParser, lxml
+from benchmarks import corpus
+
+
+def load_dir(path):
+    bodies = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), 'r', encoding='utf-8', errors='replace') as f:
+            bodies.append(("file", f.read()))
+    return bodies
+
+
+def bench(backend, bodies, repeat):
+    parser = EmailParser(backend)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        outputs = [parser.parse(body) for _, body in bodies]
+    elapsed = time.perf_counter() - start
+
+    # Peak memory is measured separately, tracemalloc slows everything down
+    peak = 0
+    for _, body in bodies:
+        tracemalloc.start()
+        parser.parse(body)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return outputs, elapsed, peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--count", type=int, default=200)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--dir", help="Use the HTML/text files in this directory instead")
+    args = arg_parser.parse_args()
+
+    bodies = load_dir(args.dir) if args.dir else corpus.generate(args.count)
+    total_mb = sum(len(body.encode('utf-8')) for _, body in bodies) / 1e6
+    print(f"Corpus: {len(bodies)} emails, {total_mb:.1f} MB, repeat={args.repeat}\n")
+
+    backends = ['soup', 'fast'] + (['lxml'] if lxml is not None else [])
+    reference = None
+
+    print(f"{'backend':>8} {'emails/s':>10} {'MB/s':>8} {'peak KB':>9} {'differ':>7}")
+    for backend in backends:
+        outputs, elapsed, peak = bench(backend, bodies, args.repeat)
+        if reference is None:
+            reference = outputs
+        differ = sum(a != b for a, b in zip(outputs, reference))
+        print(
+            f"{backend:>8} {len(bodies) * args.repeat / elapsed:>10.1f} "
+            f"{total_mb * args.repeat / elapsed:>8.2f} {peak / 1024:>9.0f} {differ:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Runs the full email pipeline offline, against local fake Gmail, Calendar and
+Ollama servers (benchmarks/fake_servers.py) and a synthetic mailbox.
+
+    python -m benchmarks.bench_pipeline [--count 300] [--google-latency 0.05]
+        [--llm-latency 0.2] [--token-latency 0.0] [--json out.json] [--baseline old.json]
+
+Reports emails/s and p50/p95/p99 latency per stage. Stage latency is the time
+spent inside the stage's function, so for batch stages every email in a batch
+gets the whole batch's time. Save a run with --json and pass it as --baseline
+to a later run to see the difference.
+The pipeline is the one main.py builds, with the current src/config.py, minus
+the LLM cache and the kNN index (both would hide the work being measured).
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from google.auth.credentials import AnonymousCredentials
+from benchmarks import corpus
+from benchmarks.fake_servers import FakeGoogle, FakeOllama
+from main import build_pipeline
+from src.services.auth import CredentialManager
+from src.services.gmail_api import GmailClient
+from src.services.gcal_api import GCalClient
+from src.services.llm_api import OllamaClient
+from src.services.scheduler import RequestScheduler
+from src.utils.rules import RuleClassifier
+from src.utils.metrics import Metrics
+from src.ui.text_io import TextIO
+from src.config import PRECLASSIFY_RULES, RULES_PATH
+
+
+class QuietIO(TextIO):
+    """Drops the clients' progress output, errors are counted from the results."""
+
+    def show_str(self, s):
+        pass
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def run(args):
+    messages = [message for _, message in corpus.generate_messages(args.count, args.seed)]
+    google = FakeGoogle(messages, latency=args.google_latency).start()
+    ollama = FakeOllama(latency=args.llm_latency, token_latency=args.token_latency).start()
+    ui = QuietIO()
+
+    try:
+        # Anonymous credentials: nothing to sign in to, the fakes don't check
+        auth = CredentialManager(ui, interactive=False, root_url=google.url)
+        auth.creds = AnonymousCredentials()
+        auth.account_email = "bench@example.com"
+
+        with tempfile.TemporaryDirectory() as tmp:
+            metrics = Metrics()
+            scheduler = RequestScheduler(ui, metrics)
+            gmail = GmailClient(auth, ui, scheduler)
+            gcal = GCalClient(auth, ui, scheduler, cache_path=os.path.join(tmp, "calendar_cache.json"))
+            ai = OllamaClient(ui=ui, host=ollama.url, cache=False, metrics=metrics)
+            rules = RuleClassifier(RULES_PATH) if PRECLASSIFY_RULES else None
+            pipeline = build_pipeline(gmail, gcal, ai, rules)
+
+            stage_times = {}
+            errors = 0
+            start = time.perf_counter()
+            for result in pipeline.run(gmail.iter_unread_emails(max_results=args.count)):
+                if result.error is not None:
+                    errors += 1
+                for stage, seconds in result.timings.items():
+                    stage_times.setdefault(stage, []).append(seconds)
+            elapsed = time.perf_counter() - start
+    finally:
+        google.stop()
+        ollama.stop()
+
+    stages = {}
+    for stage, times in stage_times.items():
+        times.sort()
+        stages[stage] = {
+            "count": len(times),
+            "p50_ms": percentile(times, 50) * 1000,
+            "p95_ms": percentile(times, 95) * 1000,
+            "p99_ms": percentile(times, 99) * 1000,
+        }
+
+    return {
+        "emails": args.count,
+        "errors": errors,
+        "seconds": elapsed,
+        "emails_per_second": args.count / elapsed if elapsed else 0.0,
+        "stages": stages,
+        "google_requests": google.requests,
+        "google_calls": google.sub_requests,
+        "llm_requests": ollama.requests,
+        "llm_prompt_tokens": ollama.prompt_tokens,
+        "llm_output_tokens": ollama.output_tokens,
+        "api": dict(scheduler.stats),
+        # Per-method Google API latency and per-task LLM token counts
+        "metrics": metrics.summary(),
+        "settings": {
+            "seed": args.seed,
+            "google_latency": args.google_latency,
+            "llm_latency": args.llm_latency,
+            "token_latency": args.token_latency,
+        },
+    }
+
+
+def report(result, baseline=None):
+    def change(value, key, stage=None):
+        if not baseline:
+            return ""
+        old = baseline['stages'].get(stage, {}).get(key) if stage else baseline.get(key)
+        if not old:
+            return ""
+        return f" ({(value - old) / old:+.0%})"
+
+    print(
+        f"{result['emails']} emails in {result['seconds']:.2f}s: "
+        f"{result['emails_per_second']:.1f} emails/s"
+        f"{change(result['emails_per_second'], 'emails_per_second')}, {result['errors']} errors"
+    )
+    print(
+        f"Google: {result['google_requests']} HTTP requests ({result['google_calls']} calls), "
+        f"{result['api']['retries']} retries. "
+        f"LLM: {result['llm_requests']} requests, {result['llm_prompt_tokens']} prompt / "
+        f"{result['llm_output_tokens']} output tokens\n"
+    )
+
+    print(f"{'stage':>12} {'count':>6} {'p50 ms':>15} {'p95 ms':>15} {'p99 ms':>15}")
+    for stage, row in result['stages'].items():
+        print(
+            f"{stage:>12} {row['count']:>6}"
+            + "".join(
+                f" {row[key]:>8.1f}{change(row[key], key, stage):>7}"
+                for key in ('p50_ms', 'p95_ms', 'p99_ms')
+            )
+        )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--count", type=int, default=300)
+    arg_parser.add_argument("--seed", type=int, default=1234)
+    arg_parser.add_argument("--google-latency", type=float, default=0.05,
+                            help="Seconds per Gmail/Calendar HTTP request (a batch counts once)")
+    arg_parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per Ollama request")
+    arg_parser.add_argument("--token-latency", type=float, default=0.0,
+                            help="Extra seconds per generated token")
+    arg_parser.add_argument("--json", help="Write the results to this file")
+    arg_parser.add_argument("--baseline", help="Results of an earlier run (--json) to compare against")
+    args = arg_parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    result = run(args)
+    report(result, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import base64
+import random
+from datetime import datetime, timedelta, timezone
+
+WORDS = (
+    "meeting project update invoice schedule team offer sale discount webinar "
+    "deadline review please attached report quarterly event join register free "
+    "limited time exclusive members newsletter welcome hackathon interview club "
+    "scholarship internship application grade assignment professor campus"
+).split()
+
+
+def sentence(rng, min_words=6, max_words=18):
+    words = rng.choices(WORDS, k=rng.randint(min_words, max_words))
+    return " ".join(words).capitalize() + "."
+
+
+def plain_email(rng, paragraphs):
+    return "\n\n".join(
+        " ".join(sentence(rng) for _ in range(rng.randint(2, 5)))
+        for _ in range(paragraphs)
+    )
+
+
+def marketing_html(rng, blocks):
+    """
+    A table-heavy marketing email: inline CSS, tracking pixels, inline SVG icons,
+    links everywhere and a script or two, like the ones that dominate parse time.
+    """
+    parts = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>Newsletter</title>",
+        "<style>" + "".join(f".c{i}{{color:#{i:06x};padding:{i}px}}" for i in range(40)) + "</style>",
+        "<link rel='stylesheet' href='https://example.com/s.css'></head><body>",
+        "<table width='100%' cellpadding='0' cellspacing='0'>",
+    ]
+    for i in range(blocks):
+        parts.append(
+            f"<tr><td class='c{i % 40}' style='font-family:Arial;font-size:14px'>"
+            f"<h2>{sentence(rng, 3, 7)}</h2><p>{sentence(rng)} <b>{sentence(rng, 2, 4)}</b> "
+            f"{sentence(rng)}</p>"
+            # Removed elements inside a run of text, with no whitespace around them
+            f"<p>{sentence(rng, 2, 5)}<a href='https://example.com/l/{i}'>here</a>{sentence(rng, 2, 5)}"
+            f"<script>track({i})</script>{sentence(rng, 2, 5)}</p>"
+            f"<a href='https://example.com/track?id={i}&amp;u=1'>{sentence(rng, 2, 4)}</a>"
+            f"<svg width='16' height='16'><path d='M0 0L{i} 16'/><use href='#i{i}'/></svg>"
+            f"<img src='https://example.com/px/{i}.gif' width='1' height='1'>"
+            "</td></tr>"
+        )
+        if i % 10 == 0:
+            parts.append(f"<script>window.t{i}=function(){{return {i};}};</script>")
+            parts.append("<!-- tracking block -->")
+    parts.append("</table><p>You are receiving this because you signed up. &copy; 2024</p>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def generate(count=200, seed=1234):
+    """
+    Deterministic corpus of email bodies with a realistic size spread: mostly
+    small plain-text mails, a good share of mid-size HTML and a long tail of
+    very large marketing mails.
+    Returns a list of (kind, body) tuples.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.4:
+            corpus.append(("plain", plain_email(rng, rng.randint(1, 6))))
+        elif roll < 0.85:
+            corpus.append(("html", marketing_html(rng, rng.randint(5, 40))))
+        else:
+            corpus.append(("html-large", marketing_html(rng, rng.randint(150, 600))))
+    return corpus
+
+
+SENDERS = [
+    ("Campus Events", "events@university.example.edu", False),
+    ("Prof. Rivera", "rivera@university.example.edu", False),
+    ("Career Center", "careers@university.example.edu", True),
+    ("Deals Weekly", "news@deals.example.com", True),
+    ("Hackathon Team", "hello@hack.example.org", True),
+    ("Alex Kim", "alex.kim@example.com", False),
+]
+
+
+def event_email(rng):
+    """A plain invitation with a date and time in it, the kind that becomes an event."""
+    day = datetime(2024, 11, 4) + timedelta(days=rng.randint(0, 60))
+    hour = rng.randint(9, 18)
+    return (
+        f"Hi all,\n\nYou are invited to our {sentence(rng, 2, 4).rstrip('.').lower()} on "
+        f"{day:%A, %B %d %Y} at {hour}:00 in Room {rng.randint(100, 450)}. "
+        f"It will run for about {rng.randint(1, 3)} hours.\n\n"
+        + plain_email(rng, rng.randint(1, 3))
+        + "\n\nSee you there!\n--\nThe organizers"
+    )
+
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def _part(mime_type, text):
+    return {"mimeType": mime_type, "body": {"size": len(text), "data": _b64(text)}}
+
+
+def gmail_message(rng, index):
+    """
+    One message as the Gmail API returns it with format='full': single-part
+    plain or HTML, multipart/alternative, or multipart/mixed with an attachment.
+    """
+    name, address, bulk = rng.choice(SENDERS)
+    sent = datetime(2024, 11, 1, tzinfo=timezone.utc) - timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+
+    roll = rng.random()
+    if roll < 0.15:
+        kind = "event"
+        subject = f"Invitation: {sentence(rng, 2, 5).rstrip('.')}"
+        payload = _part("text/plain", event_email(rng))
+    elif roll < 0.45:
+        kind = "plain"
+        subject = sentence(rng, 3, 8).rstrip('.')
+        payload = _part("text/plain", plain_email(rng, rng.randint(1, 6)))
+    elif roll < 0.6:
+        kind = "html"
+        subject = sentence(rng, 3, 8).rstrip('.')
+        payload = _part("text/html", marketing_html(rng, rng.randint(5, 40)))
+    elif roll < 0.9:
+        kind = "alternative"
+        subject = sentence(rng, 3, 8).rstrip('.')
+        blocks = rng.randint(5, 40) if rng.random() < 0.9 else rng.randint(150, 600)
+        payload = {
+            "mimeType": "multipart/alternative",
+            "body": {"size": 0},
+            "parts": [
+                _part("text/plain", plain_email(rng, rng.randint(2, 8))),
+                _part("text/html", marketing_html(rng, blocks)),
+            ],
+        }
+    else:
+        kind = "mixed"
+        subject = sentence(rng, 3, 8).rstrip('.')
+        payload = {
+            "mimeType": "multipart/mixed",
+            "body": {"size": 0},
+            "parts": [
+                {
+                    "mimeType": "multipart/alternative",
+                    "body": {"size": 0},
+                    "parts": [
+                        _part("text/plain", plain_email(rng, rng.randint(1, 4))),
+                        _part("text/html", marketing_html(rng, rng.randint(3, 10))),
+                    ],
+                },
+                {
+                    "mimeType": "application/pdf",
+                    "filename": "report.pdf",
+                    "body": {"size": rng.randint(20000, 400000), "attachmentId": f"att-{index}"},
+                },
+            ],
+        }
+
+    headers = [
+        {"name": "From", "value": f"{name} <{address}>"},
+        {"name": "To", "value": "student@example.com"},
+        {"name": "Subject", "value": subject},
+        {"name": "Date", "value": sent.strftime('%a, %d %b %Y %H:%M:%S +0000')},
+    ]
+    if bulk:
+        domain = address.split('@')[1]
+        headers += [
+            {"name": "List-Unsubscribe", "value": f"<mailto:unsubscribe@{domain}>"},
+            {"name": "List-Id", "value": f"<news.{domain}>"},
+            {"name": "Precedence", "value": "bulk"},
+        ]
+    payload["headers"] = headers
+
+    labels = ["UNREAD", "INBOX"] + (["CATEGORY_PROMOTIONS"] if bulk else ["CATEGORY_PERSONAL"])
+    message_id = f"{index:016x}"
+    return kind, {"id": message_id, "threadId": message_id, "labelIds": labels, "payload": payload}
+
+
+def generate_messages(count=300, seed=1234):
+    """
+    Deterministic mailbox of Gmail message resources, for the fake Gmail server.
+    Returns a list of (kind, message) tuples.
+    """
+    rng = random.Random(seed)
+    return [gmail_message(rng, index) for index in range(1, count + 1)]
@@ -0,0 +1,363 @@
+"""
+Local stand-ins for the Gmail, Calendar and Ollama HTTP APIs, for benchmarks.
+
+Each server listens on 127.0.0.1 (a free port), sleeps a fixed latency per
+request and answers deterministically from what it was given, so two runs see
+exactly the same traffic. Point the clients at them with:
+
+    CredentialManager(root_url=google.url)   # or GOOGLE_API_ROOT_URL
+    OllamaClient(host=ollama.url)            # or OLLAMA_HOST
+
+Only the endpoints the agent calls are implemented.
+"""
+import json
+import re
+import threading
+import time
+import zlib
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from datetime import datetime, timedelta
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _dispatch(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        server = self.server.fake
+        server.count(self.command)
+        time.sleep(server.latency)
+        status, content_type, payload = server.handle(self.command, self.path, self.headers, body)
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if isinstance(payload, bytes):
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        # A generator of chunks: sent as they come, until done or the client hangs up
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for chunk in payload:
+                self.wfile.write(f"{len(chunk):x}\r\n".encode('ascii') + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            payload.close()
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+
+class FakeServer:
+    """
+    Runs handle(method, path, headers, body) -> (status, content_type, payload)
+    on a local port. The payload is bytes, or a generator of byte chunks to stream.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+    def count(self, method):
+        with self._lock:
+            self.requests += 1
+
+    def handle(self, method, path, headers, body):
+        raise NotImplementedError
+
+    def json_response(self, data, status=200):
+        return status, 'application/json; charset=UTF-8', json.dumps(data).encode('utf-8')
+
+    def error(self, status, message):
+        return self.json_response({"error": {"code": status, "message": message}}, status)
+
+
+class FakeGoogle(FakeServer):
+    """
+    Gmail (messages list/get/batchModify, labels list/create, profile,
+    history) and Calendar (events list, insert, import) on one root URL, plus
+    both batch endpoints. A batch request pays the latency once, like the real
+    thing. The listing honours `-label:<name>` in the query.
+    """
+
+    def __init__(self, messages, latency=0.0):
+        super().__init__(latency)
+        self.messages = {message['id']: message for message in messages}
+        self.order = [message['id'] for message in messages]
+        self.events = {}
+        self.labels = {}  # id -> name, user labels only
+        self.sub_requests = 0
+
+    def handle(self, method, path, headers, body):
+        url = urlsplit(path)
+        query = parse_qs(url.query)
+        route = url.path.strip('/')
+
+        if method == 'POST' and route.split('/')[0] == 'batch':
+            return self._batch(headers.get('Content-Type'), body)
+
+        with self._lock:
+            self.sub_requests += 1
+
+        match = re.fullmatch(r'gmail/v1/users/me/(\w+)(?:/([^/]+))?', route)
+        if match:
+            return self._gmail(method, match.group(1), match.group(2), query, body)
+
+        match = re.fullmatch(r'calendar/v3/calendars/primary/events(?:/(\w+))?', route)
+        if match:
+            return self._calendar(method, match.group(1), body)
+
+        return self.error(404, f"No fake for {method} {url.path}")
+
+    def _gmail(self, method, collection, item, query, body=b''):
+        if collection == 'profile':
+            return self.json_response({"emailAddress": "bench@example.com", "historyId": "1000"})
+
+        if collection == 'history':
+            return self.json_response({"historyId": "1000"})
+
+        if collection == 'labels' and method == 'GET':
+            return self.json_response({"labels": [
+                {"id": label_id, "name": name, "type": "user"} for label_id, name in self.labels.items()
+            ]})
+
+        if collection == 'labels' and method == 'POST':
+            name = json.loads(body or b'{}')['name']
+            with self._lock:
+                if name.lower() in (existing.lower() for existing in self.labels.values()):
+                    return self.error(409, "Label name exists or conflicts")
+                label_id = f"Label_{len(self.labels) + 1}"
+                self.labels[label_id] = name
+            return self.json_response({"id": label_id, "name": name, "type": "user"})
+
+        if collection == 'messages' and item == 'batchModify' and method == 'POST':
+            request = json.loads(body or b'{}')
+            with self._lock:
+                for message_id in request.get('ids', []):
+                    message = self.messages.get(message_id)
+                    if message is None:
+                        continue
+                    labels = [label for label in message['labelIds'] if label not in request.get('removeLabelIds', [])]
+                    labels += [label for label in request.get('addLabelIds', []) if label not in labels]
+                    self.messages[message_id] = {**message, "labelIds": labels}
+            return 204, 'application/json; charset=UTF-8', b''
+
+        if collection == 'messages' and item is None:
+            order = self._matching(query.get('q', [''])[0])
+            offset = int(query.get('pageToken', ['0'])[0])
+            size = int(query.get('maxResults', ['100'])[0])
+            page = order[offset:offset + size]
+            response = {
+                "messages": [{"id": message_id, "threadId": message_id} for message_id in page],
+                "resultSizeEstimate": len(order),
+            }
+            if offset + size < len(order):
+                response["nextPageToken"] = str(offset + size)
+            return self.json_response(response)
+
+        if collection == 'messages' and item in self.messages:
+            message = self.messages[item]
+            if query.get('format', ['full'])[0] == 'metadata':
+                wanted = {name.lower() for name in query.get('metadataHeaders', [])}
+                headers = [
+                    header for header in message['payload']['headers']
+                    if not wanted or header['name'].lower() in wanted
+                ]
+                message = {**message, "payload": {"headers": headers}}
+            return self.json_response(message)
+
+        return self.error(404, "Requested entity was not found.")
+
+    def _matching(self, q):
+        """Message ids in listing order, minus those with a label the query excludes."""
+        excluded_names = {name.lower() for name in re.findall(r'-label:(\S+)', q)}
+        excluded = {label_id for label_id, name in self.labels.items() if name.lower() in excluded_names}
+        return [
+            message_id for message_id in self.order
+            if not excluded.intersection(self.messages[message_id]['labelIds'])
+        ]
+
+    def _calendar(self, method, action, body):
+        if method == 'GET' and action is None:
+            return self.json_response({"items": list(self.events.values()), "nextSyncToken": "sync-1"})
+
+        if method == 'POST' and action in (None, 'import'):
+            event = json.loads(body or b'{}')
+            event_id = event.get('iCalUID') or f"ev{len(self.events)}"
+            event_id = f"{zlib.crc32(event_id.encode('utf-8')):08x}"
+            event.update({
+                "id": event_id,
+                "status": "confirmed",
+                "htmlLink": f"https://calendar.example.com/event?eid={event_id}",
+            })
+            with self._lock:
+                self.events[event_id] = event
+            return self.json_response(event)
+
+        return self.error(404, "Not found")
+
+    def _batch(self, content_type, body):
+        """Splits a multipart/mixed batch, runs each part and joins the answers."""
+        envelope = BytesParser().parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + body
+        )
+        boundary = "batch_fake_boundary"
+        out = []
+        for part in envelope.get_payload():
+            request = part.get_payload(decode=False)
+            head, separator, sub_body = request.partition('\r\n\r\n')
+            if not separator:
+                head, separator, sub_body = request.partition('\n\n')
+            sub_method, sub_path = head.splitlines()[0].split(' ')[:2]
+
+            status, sub_type, payload = self.handle(sub_method, sub_path, {}, sub_body.encode('utf-8'))
+            content_id = part['Content-ID'].strip('<>')
+            out.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: {sub_type}\r\nContent-Length: {len(payload)}\r\n\r\n"
+                f"{payload.decode('utf-8')}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        return 200, f"multipart/mixed; boundary={boundary}", "".join(out).encode('utf-8')
+
+
+class FakeOllama(FakeServer):
+    """
+    /api/chat and /api/generate. Answers fit the request's JSON schema, fields
+    in schema order: the category is derived from a hash of the email,
+    invitations are always Events. token_latency adds that many seconds per
+    generated token, on top of latency. With "stream": true the answer comes as
+    NDJSON, one ~4-character token per line, and generation stops when the
+    client disconnects (only the tokens sent are counted).
+    """
+
+    CATEGORIES = ["Important", "Opportunity", "Unimportant"]
+
+    def __init__(self, latency=0.0, token_latency=0.0):
+        super().__init__(latency)
+        self.token_latency = token_latency
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def handle(self, method, path, headers, body):
+        request = json.loads(body or b'{}')
+        route = urlsplit(path).path
+
+        if route == '/api/generate':
+            return self.json_response({
+                "model": request.get('model'), "created_at": datetime.now().isoformat(),
+                "response": "", "done": True, "load_duration": 0, "total_duration": 0,
+            })
+
+        if route != '/api/chat':
+            return self.error(404, "Not found")
+
+        prompt = request['messages'][-1]['content']
+        content = json.dumps(self._answer(prompt, request.get('format') or {}))
+        prompt_tokens = len(prompt) // 4
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+
+        if request.get('stream'):
+            return 200, 'application/x-ndjson', self._stream(request, content, prompt_tokens)
+
+        output_tokens = len(content) // 4
+        with self._lock:
+            self.output_tokens += output_tokens
+        time.sleep(self.token_latency * output_tokens)
+        return self.json_response(self._chunk(request, content, True, prompt_tokens, output_tokens))
+
+    def _stream(self, request, content, prompt_tokens):
+        tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+        for token in tokens:
+            time.sleep(self.token_latency)
+            with self._lock:
+                self.output_tokens += 1
+            yield json.dumps(self._chunk(request, token, False)).encode('utf-8') + b"\n"
+        yield json.dumps(self._chunk(request, "", True, prompt_tokens, len(tokens))).encode('utf-8') + b"\n"
+
+    def _chunk(self, request, content, done, prompt_tokens=0, output_tokens=0):
+        chunk = {
+            "model": request.get('model'),
+            "created_at": datetime.now().isoformat(),
+            "message": {"role": "assistant", "content": content},
+            "done": done,
+        }
+        if done:
+            chunk.update({
+                "done_reason": "stop",
+                "load_duration": 0,
+                "total_duration": int((self.latency + self.token_latency * output_tokens) * 1e9),
+                "prompt_eval_count": prompt_tokens,
+                "eval_count": output_tokens,
+            })
+        return chunk
+
+    def _answer(self, prompt, schema):
+        properties = schema.get('properties', {})
+
+        if 'results' in properties:
+            sections = re.split(r'### Email (\d+)\n', prompt)[1:]
+            return {"results": [
+                {"index": int(index), "category": self._category(text)}
+                for index, text in zip(sections[::2], sections[1::2])
+            ]}
+
+        answer = {}
+        if 'reasoning' in properties:
+            answer['reasoning'] = "Deterministic benchmark answer."
+        if 'category' in properties:
+            answer['category'] = self._category(prompt)
+        if 'summary' in properties and answer.get('category', "Event") == "Event":
+            answer.update(self._event(prompt))
+        # Constrained decoding writes the fields in the order the schema lists them
+        return {name: answer[name] for name in properties if name in answer}
+
+    def _category(self, text):
+        if "Invitation:" in text:
+            return "Event"
+        return self.CATEGORIES[zlib.crc32(text.encode('utf-8')) % len(self.CATEGORIES)]
+
+    def _event(self, prompt):
+        seed = zlib.crc32(prompt.encode('utf-8'))
+        start = datetime(2024, 11, 4, 9) + timedelta(days=seed % 60, hours=seed % 9)
+        subject = re.search(r'Subject: (?:Invitation: )?(.*)', prompt)
+        return {
+            "summary": subject.group(1).strip() if subject else "Event",
+            "description": "",
+            "location": f"Room {100 + seed % 350}",
+            "start": {"dateTime": start.isoformat()},
+            "end": {"dateTime": (start + timedelta(hours=1 + seed % 3)).isoformat()},
+        }
@@ -1,57 +1,453 @@
+import argparse
+import itertools
+import sys
+import time
 from src.services.gmail_api import GmailClient
 from src.services.gcal_api import GCalClient
+from src.services.auth import CredentialManager
+from src.services.scheduler import RequestScheduler
 from src.services.llm_api import OllamaClient
 from src.utils.parser import EmailParser
+from src.utils.pipeline import Pipeline, Stage
+from src.utils.rules import RuleClassifier
+from src.utils.knn import KNNClassifier
+from src.utils.condenser import EmailCondenser
+from src.utils.metrics import Metrics, NullMetrics
+from src.utils.store import MessageStore
 from src.ui.text_io import TextIO, Constants
+from src.ui.jsonl_io import JsonlIO
+from src.config import (
+    INCREMENTAL_SYNC, MAX_EMAILS_PER_RUN, DEFAULT_ACCOUNT, GMAIL_BATCH_SIZE, CALENDAR_BATCH_SIZE,
+    CALENDAR_SKIP_DUPLICATES, SYNC_MAX_RETRIES, PIPELINE_WORKERS,
+    PIPELINE_QUEUE_SIZE, CLASSIFY_BATCH_SIZE, COMBINED_CLASSIFY_EXTRACT, PRECLASSIFY_RULES, RULES_PATH, KNN_ENABLED,
+    KNN_INDEX_PATH, KNN_DIM, KNN_K, KNN_MIN_EXAMPLES, KNN_CONFIDENCE_THRESHOLD, PARSER_BACKEND,
+    CLASSIFY_TOKEN_BUDGET, EXTRACT_TOKEN_BUDGET, COMBINED_TOKEN_BUDGET,
+    MESSAGE_STORE_ENABLED, MESSAGE_STORE_PATH, MESSAGE_STORE_RETENTION_DAYS,
+    GMAIL_WRITE_BACK, PROCESSED_LABEL, CATEGORY_LABEL_PREFIX, GMAIL_MODIFY_BATCH_SIZE,
+    METRICS_ENABLED, METRICS_JSON_PATH, METRICS_PROMETHEUS_PATH, DEBUG_MODE
+)
 
 def get_full_text(email_body, subject):
-    clean_body = EmailParser().parse(email_body)
+    clean_body = EmailParser(PARSER_BACKEND).parse(email_body)
     full_text = f"Subject: {subject}\n{clean_body}"
     return full_text
 
-def main():
-    ui = TextIO()
+def build_pipeline(gmail, gcal, ai, rules=None, knn=None, store=None):
+    """Wires the per-email steps into a concurrent, order-preserving pipeline."""
+    condenser = EmailCondenser()
+    # Metadata fetches must include every header a rule can match on
+    rule_headers = rules.header_names() if rules else []
+
+    def fetch(stubs):
+        ids = [stub['id'] for stub in stubs]
+        # Emails seen on an earlier run come from the local store, text and all
+        stored = store.get_many(ids) if store else {}
+        if not rules:
+            # No body stage to fill in the text later, so those without it are fetched again
+            stored = {
+                message_id: email for message_id, email in stored.items()
+                if email['text'] is not None or email['category'] not in (None, "Event")
+            }
+        missing = [message_id for message_id in ids if message_id not in stored]
+
+        fetched = {}
+        if missing:
+            # With rules on, triage needs only headers and labels; bodies come later
+            batch = (
+                gmail.get_email_metadata_batch(missing, rule_headers) if rules
+                else gmail.get_email_details_batch(missing)
+            )
+            fetched = {d['id']: d for d in batch}
+
+        results = []
+        for message_id in ids:
+            d = stored.get(message_id) or fetched[message_id]
+            if 'error' in d:
+                results.append(RuntimeError(f"Failed to fetch email {d['id']}: {d['error']}"))
+            else:
+                results.append(d)
+        return results
+
+    def fetch_body(batch):
+        # Only emails the rules didn't settle go on to the LLM and need their body
+        pending = [
+            d['id'] for d in batch
+            if d.get('category') in (None, "Event") and d.get('text') is None
+        ]
+        if not pending:
+            return batch
+
+        bodies = {body['id']: body for body in gmail.get_email_bodies_batch(pending)}
+        results = []
+        for details in batch:
+            body = bodies.get(details['id'])
+            if body and 'error' in body:
+                results.append(RuntimeError(f"Failed to fetch email {body['id']}: {body['error']}"))
+                continue
+            if body:
+                details['body'] = body['body']
+            results.append(details)
+        return results
+
+    def preclassify(details):
+        if details.get('category'):
+            return details  # Already classified on an earlier run
+        details['category'], details['rule'] = rules.classify(details)
+        return details
+
+    def parse(details):
+        if details.get('category') and details['category'] != "Event":
+            return details  # Settled by a rule, the LLM never sees it
+        # Stored emails were parsed when they were first seen
+        if details.get('text') is None:
+            details['text'] = get_full_text(details['body'], details['subject'])
+        # Condense once to the largest budget; each prompt trims further to its own
+        details['full_text'], details['condensed'] = condenser.condense(
+            details['text'], max(CLASSIFY_TOKEN_BUDGET, EXTRACT_TOKEN_BUDGET, COMBINED_TOKEN_BUDGET)
+        )
+        return details
+
+    def recall(details):
+        # Skip the LLM when the email closely matches ones it has already labelled.
+        # Anything a rule looked at (including allow-listed senders) is left alone.
+        if details.get('category') or details.get('rule') or len(knn) < KNN_MIN_EXAMPLES:
+            return details
+
+        label, confidence = knn.classify(details['full_text'])
+        if confidence >= KNN_CONFIDENCE_THRESHOLD:
+            details['category'] = label
+            details['rule'] = f"knn {confidence:.2f}"
+        return details
+
+    def learn(details):
+        # Only called with a real LLM answer; texts already in the index (e.g. an
+        # answer served from the LLM cache on a re-run) are skipped by knn.add
+        if knn:
+            knn.add(details['full_text'], details['category'])
+
+    def classify(details):
+        if not details.get('category'):
+            category = ai.categorize_email(details['full_text'])
+            if category is None:
+                # Fail the email rather than guess, so the next run tries again
+                raise RuntimeError("LLM classification failed")
+            details['category'] = category
+            learn(details)
+        return details
+
+    def classify_and_extract(details):
+        if not details.get('category'):
+            category, event = ai.categorize_and_extract(details['full_text'], details['date'])
+            if category is None:
+                raise RuntimeError("LLM classification failed")
+            details['category'], details['event'] = category, event
+            learn(details)
+        return details
+
+    def classify_batch(batch):
+        # Several emails per LLM call, whatever is queued up (up to CLASSIFY_BATCH_SIZE)
+        pending = [details for details in batch if not details.get('category')]
+        failed = set()
+        if pending:
+            categories = ai.categorize_emails([details['full_text'] for details in pending])
+            for details, category in zip(pending, categories):
+                if category is None:
+                    failed.add(details['id'])
+                    continue
+                details['category'] = category
+                learn(details)
+        return [
+            RuntimeError("LLM classification failed") if details['id'] in failed else details
+            for details in batch
+        ]
+
+    def extract(details):
+        # Skipped when the single-pass mode already extracted the event, or a
+        # stored email's event is already on the calendar or has used up its retries
+        if (
+            details['category'] == "Event" and 'event' not in details and not details.get('event_link')
+            and details.get('attempts', 0) <= SYNC_MAX_RETRIES
+        ):
+            details['event'] = ai.create_event(details['full_text'], details['date'])
+        return details
+
+    def insert(batch):
+        # One Calendar batch request for all the events that are queued up
+        pending = [details for details in batch if details.get('event')]
+        if not pending:
+            return batch
+
+        for details in pending:
+            # Tied to the email, so a re-run imports over the same event
+            details['event'].uid = details['event'].make_uid(details['id'])
+            # Answered from the cached calendar window, no API call per event
+            check = gcal.check_event(details['event'])
+            details['duplicate_of'] = check['duplicate']
+            details['conflicts'] = check['conflicts']
+            if check['imported']:
+                # A re-run of an email whose event is already on the calendar
+                details['event_link'] = check['imported']['link']
+                details['event_error'] = None
+
+        pending = [details for details in pending if not details.get('event_link')]
+        if CALENDAR_SKIP_DUPLICATES:
+            pending = [details for details in pending if not details['duplicate_of']]
+
+        results = gcal.add_events([details['event'] for details in pending])
+        for details, result in zip(pending, results):
+            details['event_link'] = result['link']
+            details['event_error'] = result['error']
+        return batch
+
+    stages = [
+        Stage('fetch', fetch, workers=PIPELINE_WORKERS['fetch'], batch_size=GMAIL_BATCH_SIZE),
+    ]
+    if rules:
+        stages.append(Stage('rules', preclassify))
+        stages.append(Stage(
+            'fetch_body', fetch_body,
+            workers=PIPELINE_WORKERS['fetch'], batch_size=GMAIL_BATCH_SIZE
+        ))
+
+    stages.append(Stage('parse', parse, workers=PIPELINE_WORKERS['parse']))
+    if knn:
+        stages.append(Stage('knn', recall))
+
+    if COMBINED_CLASSIFY_EXTRACT:
+        stages.append(Stage('classify', classify_and_extract, workers=PIPELINE_WORKERS['classify']))
+    elif CLASSIFY_BATCH_SIZE > 1:
+        stages.append(Stage(
+            'classify', classify_batch,
+            workers=PIPELINE_WORKERS['classify'], batch_size=CLASSIFY_BATCH_SIZE
+        ))
+    else:
+        stages.append(Stage('classify', classify, workers=PIPELINE_WORKERS['classify']))
+
+    stages += [
+        Stage('extract', extract, workers=PIPELINE_WORKERS['extract']),
+        Stage('insert', insert, workers=PIPELINE_WORKERS['insert'], batch_size=CALENDAR_BATCH_SIZE),
+    ]
+    return Pipeline(stages, queue_size=PIPELINE_QUEUE_SIZE)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Classify unread Gmail and add events to Google Calendar.")
+    parser.add_argument(
+        "--headless", action="store_true",
+        help="Never prompt; write one JSON record per email instead of the text UI."
+    )
+    parser.add_argument(
+        "--account", default=DEFAULT_ACCOUNT,
+        help="Saved account to use without prompting (default: $GMAIL_AGENT_ACCOUNT)."
+    )
+    parser.add_argument(
+        "--output", default="-",
+        help="Where --headless writes its JSON lines (default: stdout)."
+    )
+    parser.add_argument(
+        "--max-emails", type=int, default=MAX_EMAILS_PER_RUN,
+        help="Stop after this many emails."
+    )
+    return parser.parse_args(argv)
+
+def email_record(result):
+    """The JSON line written for one email in headless mode."""
+    details = result.value or {}
+    return {
+        "id": details.get('id'),
+        "subject": details.get('subject'),
+        "sender": details.get('sender'),
+        "category": details.get('category'),
+        "rule": details.get('rule'),
+        "event_link": details.get('event_link'),
+        "event_error": details.get('event_error'),
+        "duplicate_of": details.get('duplicate_of'),
+        "conflicts": details.get('conflicts'),
+        "error": f"{result.stage}: {result.error}" if result.error is not None else None,
+        "timings": result.timings,
+    }
+
+def main(argv=None):
+    startup_start = time.perf_counter()
+    args = parse_args(argv)
+
+    if args.headless:
+        output = sys.stdout if args.output == "-" else open(args.output, 'a')
+        ui = JsonlIO(output)
+    else:
+        ui = TextIO()
     ui.show_cover()
+
+    try:
+        run(ui, args, startup_start)
+    finally:
+        ui.close()
+
+def write_metrics(metrics, gmail):
+    """Adds the run totals and writes the JSON and Prometheus summaries."""
+    if not METRICS_ENABLED:
+        return
+    metrics.add("gmail_bytes_fetched", gmail.bytes_fetched)
+    metrics.write_json(METRICS_JSON_PATH)
+    metrics.write_prometheus(METRICS_PROMETHEUS_PATH)
+
+def event_missing(details):
+    """True for an Event email whose event isn't on the calendar (and wasn't skipped as a duplicate)."""
+    if details.get('category') != "Event" or details.get('event_link'):
+        return False
+    return not (CALENDAR_SKIP_DUPLICATES and details.get('duplicate_of'))
+
+def write_back(ui, gmail, metrics, processed):
+    """
+    Labels the processed emails in Gmail, given as {category: [message ids]}.
+    Returns the ids that couldn't be labelled.
+    """
+    unlabelled = []
+    for category, message_ids in processed.items():
+        label_names = [PROCESSED_LABEL]
+        if CATEGORY_LABEL_PREFIX:
+            label_names.append(f"{CATEGORY_LABEL_PREFIX}/{category}")
+        try:
+            gmail.label_emails(message_ids, label_names)
+        except Exception as e:
+            # Retried next run (from the message store, if on, so without the LLM)
+            ui.show_error(f"Failed to label {len(message_ids)} {category} emails in Gmail: {e}")
+            unlabelled += message_ids
+            continue
+        metrics.add("gmail_labelled", len(message_ids), category=category)
+    return unlabelled
+
+def run(ui, args, startup_start):
+    metrics = Metrics() if METRICS_ENABLED else NullMetrics()
+    # Start loading the model first so it overlaps with the Google sign-in
+    ai = OllamaClient(warm_up=True, ui=ui, metrics=metrics)
+    # One sign-in shared by both Google clients
+    auth = CredentialManager(ui, account=args.account, interactive=not args.headless)
+    # ...and one scheduler, so both stay within quota together
+    scheduler = RequestScheduler(ui, metrics)
+    gmail = GmailClient(auth, ui, scheduler)
+    gcal = GCalClient(auth, ui, scheduler)
+
+    metrics.observe("startup_seconds", time.perf_counter() - startup_start, step="total")
+    metrics.observe("startup_seconds", auth.timings["auth_seconds"], step="auth")
+    metrics.observe("startup_seconds", auth.timings["discovery_seconds"], step="discovery")
+
+    if DEBUG_MODE:
+        ui.show_formatted_msg(
+            Constants.STARTUP_TIME,
+            seconds=time.perf_counter() - startup_start,
+            **auth.timings
+        )
     
-    gmail = GmailClient()
-    gcal = GCalClient()
-    ai = OllamaClient()
-    
-    messages = gmail.get_unread_emails(limit=10) # We can process more now!
+    # Stream the backlog page by page; the pipeline fetches details in batches
+    if INCREMENTAL_SYNC:
+        emails = gmail.iter_new_unread_emails(max_results=args.max_emails)
+    else:
+        emails = gmail.iter_unread_emails(max_results=args.max_emails)
 
-    if not messages:
+    first = next(emails, None)
+    if first is None:
         ui.show_msg(Constants.NO_UNREAD)
+        if INCREMENTAL_SYNC:
+            gmail.save_sync_checkpoint()
+        write_metrics(metrics, gmail)
         return
 
     ui.show_msg(Constants.CLASSIFYING)
 
-    impt_msgs = []
-    oppor_msgs = []
+    # Message ids waiting to be labelled, by category
+    processed = {}
+    # ...and those to try again next run
+    failed_ids = []
 
-    for msg in messages:
-        details = gmail.get_email_details(msg['id'])
-        full_text = get_full_text(details['body'], details['subject'])
-        
-        category = ai.categorize_email(full_text)
+    rules = RuleClassifier(RULES_PATH) if PRECLASSIFY_RULES else None
+    knn = KNNClassifier(KNN_INDEX_PATH, dim=KNN_DIM, k=KNN_K) if KNN_ENABLED else None
+    store = MessageStore(MESSAGE_STORE_PATH, MESSAGE_STORE_RETENTION_DAYS) if MESSAGE_STORE_ENABLED else None
+    pipeline = build_pipeline(gmail, gcal, ai, rules, knn, store)
 
-        ui.show_categorized_email(category, details['subject'])
+    # Results come back in listing order, whatever order the workers finished in
+    for result in pipeline.run(itertools.chain([first], emails)):
+        ui.record_email(email_record(result))
+        for stage, seconds in result.timings.items():
+            metrics.observe("stage_seconds", seconds, stage=stage)
+        metrics.observe("email_seconds", sum(result.timings.values()))
 
-        if category == "Event":
-            ui.show_msg(Constants.GENERATING_EVENT)
-            ics_string = ai.create_event(full_text, details['date'])
+        if result.error is not None:
+            metrics.add("emails", outcome="error")
+            ui.show_error(f"{result.stage} failed: {result.error}")
+            failed_ids.append(result.value['id'])
+            # Keep what we got this far, so the retry doesn't download it again
+            if store and result.value and 'subject' in result.value:
+                store.save(result.value, 'classified' if result.value.get('category') else 'fetched')
+            continue
+
+        details = result.value
+        category = details['category']
+        metrics.add("emails", outcome=category)
+        attempts = 0
+        if store:
+            attempts = store.save(details, 'event_failed' if event_missing(details) else 'done')
 
-            if ics_string:
+        ui.show_categorized_email(category, details['subject'], details.get('rule'))
+        if DEBUG_MODE and details.get('condensed'):
+            ui.show_formatted_msg(Constants.CONDENSED, **details['condensed'])
+
+        if category == "Event":
+            if details.get('event'):
                 ui.show_msg(Constants.EVENT_CREATED)
-                ui.show_event(ics_string)
-                gcal.add_ics_event(ics_string)
+                ui.show_event(details['event'].to_ics())
+                duplicate = details.get('duplicate_of')
+                if duplicate and CALENDAR_SKIP_DUPLICATES:
+                    ui.show_formatted_msg(Constants.EVENT_SKIPPED, **duplicate)
+                elif details.get('event_link'):
+                    ui.show_msg(Constants.EVENT_ADDED)
+                elif details.get('event_error'):
+                    ui.show_error(f"Failed to add event to Google Calendar: {details['event_error']}")
+
+                if duplicate and not CALENDAR_SKIP_DUPLICATES:
+                    ui.show_formatted_msg(Constants.EVENT_DUPLICATE, **duplicate)
+                if details.get('conflicts'):
+                    ui.show_formatted_msg(Constants.EVENT_CONFLICTS, summaries=", ".join(
+                        f"\"{event['summary']}\" ({event['start']})" for event in details['conflicts']
+                    ))
+            elif details.get('event_link'):
                 ui.show_msg(Constants.EVENT_ADDED)
 
-        elif category == "Important":
-            impt_msgs.append(details)
+        # An event that didn't make it to the calendar stays unlabelled and is retried,
+        # up to SYNC_MAX_RETRIES more runs when the store is counting, in either sync mode
+        if event_missing(details) and attempts <= SYNC_MAX_RETRIES:
+            failed_ids.append(details['id'])
+        elif GMAIL_WRITE_BACK:
+            if event_missing(details) and attempts == SYNC_MAX_RETRIES + 1:
+                ui.show_error(f"Giving up on the event in \"{details['subject']}\" after {attempts} attempts.")
+            message_ids = processed.setdefault(category, [])
+            message_ids.append(details['id'])
+            if len(message_ids) >= GMAIL_MODIFY_BATCH_SIZE:
+                failed_ids += write_back(ui, gmail, metrics, {category: processed.pop(category)})
+
+    failed_ids += write_back(ui, gmail, metrics, processed)
+
+    if knn:
+        knn.save()
+
+    # Only move the checkpoint forward once this delta has been processed,
+    # remembering what failed so the next run picks it up again
+    if INCREMENTAL_SYNC:
+        gmail.save_sync_checkpoint(failed_ids)
+
+    write_metrics(metrics, gmail)
+
+    if DEBUG_MODE:
+        if ai.cache:
+            ui.show_formatted_msg(Constants.LLM_CACHE_STATS, **ai.cache.stats())
+        ui.show_formatted_msg(Constants.LLM_TIMINGS, **ai.timings)
+        ui.show_formatted_msg(Constants.GMAIL_BYTES, megabytes=gmail.bytes_fetched / 1e6)
+        ui.show_formatted_msg(Constants.API_STATS, concurrency=scheduler.concurrency, **scheduler.stats)
+        if store:
+            ui.show_formatted_msg(Constants.MESSAGE_STORE_STATS, **store.stats())
 
-        elif category == "Opportunity":
-            oppor_msgs.append(details)
+    if store:
+        store.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
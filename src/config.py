@@ -8,9 +8,209 @@ BASE_DIR = Path(__file__).parent.parent
 CREDENTIALS_PATH = BASE_DIR / "credentials.json"
 TOKEN_PATH = BASE_DIR / "token.json"
 
+# Send Google API requests here instead of https://www.googleapis.com/, e.g. to
+# the stand-in servers used by `python -m benchmarks.bench_pipeline`
+GOOGLE_API_ROOT_URL = os.getenv("GOOGLE_API_ROOT_URL")
+
+# Last seen Gmail historyId per account, used for incremental sync
+SYNC_STATE_PATH = BASE_DIR / "sync_state.json"
+
+# On-disk cache of LLM classification / event extraction results
+LLM_CACHE_PATH = BASE_DIR / "llm_cache.sqlite3"
+
+# Header/label rules for the pre-classifier (built-in defaults are used if missing)
+RULES_PATH = BASE_DIR / "rules.json"
+
+# Past LLM labels used by the nearest-neighbour fast path
+KNN_INDEX_PATH = BASE_DIR / "knn_index.npz"
+
+# Local copy of processed emails (parsed text, labels, classification), with a
+# full-text index. Search it with `python -m src.utils.store search ...`.
+MESSAGE_STORE_PATH = BASE_DIR / "messages.sqlite3"
+
+# Upcoming calendar events plus the Calendar syncToken, for conflict/duplicate checks
+CALENDAR_CACHE_PATH = BASE_DIR / "calendar_cache.json"
+
 SCOPES = [
     'https://www.googleapis.com/auth/gmail.modify',
     'https://www.googleapis.com/auth/calendar'  
 ]
 
-DEBUG_MODE = True  # Set to True to enable debug logging
\ No newline at end of file
+DEBUG_MODE = True  # Set to True to enable debug logging
+
+# Account used by --headless runs when --account isn't given
+DEFAULT_ACCOUNT = os.getenv("GMAIL_AGENT_ACCOUNT")
+
+# Gmail allows up to 100 calls per batch request, but recommends staying at 50
+# or below to avoid rate limiting.
+GMAIL_BATCH_SIZE = 50
+
+# Shared request scheduler for all Google API calls (src/services/scheduler.py).
+# Per-user rate per API in quota units per second: Gmail allows 250 units/s,
+# Calendar about 600 requests a minute.
+API_RATE_LIMITS = {
+    'gmail': 250,
+    'calendar': 10,
+}
+# Quota units per method (anything not listed costs 1). A batch costs the sum
+# of its requests.
+API_QUOTA_UNITS = {
+    'gmail.users.getProfile': 1,
+    'gmail.users.messages.list': 5,
+    'gmail.users.messages.get': 5,
+    'gmail.users.messages.modify': 5,
+    'gmail.users.messages.batchModify': 50,
+    'gmail.users.history.list': 2,
+    'gmail.users.labels.list': 1,
+    'gmail.users.labels.create': 5,
+}
+# Requests in flight at once start at the max and are halved when Google
+# throttles us, then grow back by one per window of successes.
+API_MAX_CONCURRENCY = 8
+API_MIN_CONCURRENCY = 1
+# Retries of 429/5xx responses, backing off exponentially (with jitter) from
+# API_BACKOFF_BASE seconds, capped at API_BACKOFF_MAX
+API_MAX_RETRIES = 5
+API_BACKOFF_BASE = 0.5
+API_BACKOFF_MAX = 32
+
+# Events per Calendar batch request. Events are imported under a UID derived
+# from the email, so re-running on the same emails updates instead of duplicating.
+CALENDAR_BATCH_SIZE = 50
+
+# Extracted events are checked against the calendar between these many days in
+# the past and the future, loaded once and then kept up to date with a syncToken.
+# Once the window has slid forward by CALENDAR_RESYNC_DAYS it is reloaded in full.
+CALENDAR_WINDOW_PAST_DAYS = 7
+CALENDAR_WINDOW_FUTURE_DAYS = 180
+CALENDAR_RESYNC_DAYS = 7
+
+# An existing event counts as a duplicate when its start and end are within
+# this many minutes and its title is at least this similar (0-1, difflib ratio).
+# With CALENDAR_SKIP_DUPLICATES the new event isn't added at all.
+DUPLICATE_TIME_TOLERANCE_MINUTES = 15
+DUPLICATE_TITLE_RATIO = 0.8
+CALENDAR_SKIP_DUPLICATES = False
+
+# Labels written back to Gmail once an email has been processed. Every email
+# gets PROCESSED_LABEL, which the unread listing then excludes, so the next run
+# only sees new mail. With CATEGORY_LABEL_PREFIX set, it also gets a
+# "<prefix>/<category>" label (e.g. Agent/Opportunity). Labels are created on
+# first use. Gmail's batchModify takes up to 1000 ids per request.
+GMAIL_WRITE_BACK = True
+PROCESSED_LABEL = "agent-processed"
+CATEGORY_LABEL_PREFIX = "Agent"
+GMAIL_MODIFY_BATCH_SIZE = 1000
+
+# Message IDs requested per messages().list page (Gmail caps this at 500)
+GMAIL_PAGE_SIZE = 100
+
+# How many pages the unread-mail iterator fetches ahead of the consumer
+GMAIL_PREFETCH_PAGES = 2
+
+# Upper bound on emails processed per run (None = drain the whole backlog).
+# With incremental sync, anything past the cap on the first full sync is skipped
+# on later runs, so keep this at None unless you really need a cap.
+MAX_EMAILS_PER_RUN = None
+
+# Only look at mail that arrived since the last run (falls back to a full sync
+# the first time, or when the saved checkpoint has expired)
+INCREMENTAL_SYNC = True
+# Emails that fail are tried again on the next incremental runs, at most this many times.
+# Event emails whose event can't be extracted are capped the same way in any sync
+# mode, counted in the message store, then labelled processed without one
+SYNC_MAX_RETRIES = 3
+
+# Worker threads per stage of the processing pipeline in main.py.
+# Classification and extraction share one local Ollama model, so raising those
+# only helps if the server is configured with OLLAMA_NUM_PARALLEL > 1.
+PIPELINE_WORKERS = {
+    'fetch': 2,
+    'parse': 1,
+    'classify': 1,
+    'extract': 1,
+    'insert': 2,
+}
+
+# Max items waiting between two pipeline stages before the upstream stage blocks
+PIPELINE_QUEUE_SIZE = 16
+
+# Reuse earlier LLM answers for emails we've already seen.
+# Entries are dropped when they get too old or the cache grows past the cap.
+LLM_CACHE_ENABLED = True
+LLM_CACHE_MAX_ENTRIES = 10000
+LLM_CACHE_MAX_AGE_DAYS = 30
+
+# Context window (in tokens) we ask Ollama for when packing several emails into
+# one classification request. Batches are sized to fit inside it.
+OLLAMA_NUM_CTX = 4096
+
+# Max emails classified in a single LLM call (1 = one call per email).
+CLASSIFY_BATCH_SIZE = 8
+
+# Settle obvious newsletters/notifications with header and label rules before
+# they reach the LLM
+PRECLASSIFY_RULES = True
+
+# Nearest-neighbour fast path that learns from the LLM's past labels.
+# Use `python -m src.utils.knn evaluate` to see coverage/agreement per threshold
+# before changing KNN_CONFIDENCE_THRESHOLD.
+KNN_ENABLED = True
+KNN_DIM = 4096
+KNN_K = 7
+KNN_MIN_EXAMPLES = 50  # Don't trust the index until it has seen this many emails
+KNN_CONFIDENCE_THRESHOLD = 0.6
+
+# Classify and extract events in a single LLM call instead of two.
+# When on, this replaces batched classification for emails that reach the LLM.
+COMBINED_CLASSIFY_EXTRACT = False
+
+# HTML-to-text backend for EmailParser: 'soup', 'fast' or 'lxml' (if installed).
+# Compare them with `python -m benchmarks.bench_parser`.
+PARSER_BACKEND = 'fast'
+
+# Emails already in the message store are not downloaded or parsed again.
+# Entries not touched for MESSAGE_STORE_RETENTION_DAYS are dropped.
+MESSAGE_STORE_ENABLED = True
+MESSAGE_STORE_RETENTION_DAYS = 90
+
+# Token budgets (estimated at ~4 characters per token) for the email text in
+# each kind of prompt. Emails are condensed (quoted replies, signatures and
+# footers removed) before being cut down to these.
+CLASSIFY_TOKEN_BUDGET = 750
+CLASSIFY_BATCH_TOKEN_BUDGET = 375  # Per email, in batched classification
+EXTRACT_TOKEN_BUDGET = 2000
+COMBINED_TOKEN_BUDGET = 1500
+
+# Context windows Ollama may be asked for. Each request gets the smallest one
+# that fits its prompt plus output, so short emails don't allocate a full-size
+# KV cache. Keep the largest at or above OLLAMA_NUM_CTX.
+OLLAMA_CTX_BUCKETS = [1024, 2048, 4096, 8192]
+
+# Caps on generated tokens per task ('category_batch' is per email in the batch)
+NUM_PREDICT = {
+    'category': 128,
+    'category_batch': 24,
+    'event': 512,
+    'combined': 512,
+}
+
+# Longest 'reasoning' the model may write. FAST_MODE drops the field entirely.
+REASONING_MAX_CHARS = 200
+FAST_MODE = False
+
+# Single-email classification streams the answer with 'category' first and
+# stops generating as soon as it is complete. The reasoning is only asked for
+# (and generated in full) in DEBUG_MODE, where it gets printed.
+STREAM_CLASSIFICATION = True
+
+# IANA time zone (e.g. "Europe/Paris") for extracted events when the email
+# doesn't name one. Unset: the machine's current UTC offset is sent instead.
+LOCAL_TIMEZONE = os.getenv("GMAIL_AGENT_TIMEZONE")
+
+# Run telemetry (stage timings, Google API latency, Ollama token counts, bytes
+# fetched), written at the end of every run as JSON and in the Prometheus text
+# format (e.g. for node_exporter's textfile collector). Off costs next to nothing.
+METRICS_ENABLED = True
+METRICS_JSON_PATH = BASE_DIR / "metrics.json"
+METRICS_PROMETHEUS_PATH = BASE_DIR / "metrics.prom"
@@ -20,6 +20,54 @@ STEP 2: In the 'category' field, select the best matching category from the list
 """
 
 
+# -----------------------------------------------------------
+
+# Category-first variant of CATEGORIZE_PROMPT for streaming classification:
+# the answer can be read as soon as 'category' is complete.
+
+STREAM_CATEGORIZE_PROMPT = """
+You are an intelligent email assistant. 
+Analyze the following email body and classify it into EXACTLY one of these categories. 
+Prioritize 'Event' if the email describes a specific occurrence with a date and time.
+
+Categories:
+1. Event: A specific activity or meeting that takes place at a specific date and time. Must be something attendable (e.g., club meetings, hackathons, webinars, flights, interviews). NOT just a deadline.
+2. Important: Emails requiring direct action or containing crucial information (e.g., from boss/professors, bills, grades, legal/medical updates).
+3. Opportunity: Solicitations for jobs, scholarships, internships, or clubs. These may have 'deadlines' but are not 'events' you attend.
+4. Unimportant: Newsletters, promotional spam, social media notifications, or generic blasts.
+
+Email Body:
+"{email_body}"
+
+Provide your response in JSON format. 
+Start with the 'category' field: the best matching category from the list above.
+If the format has a 'reasoning' field, explain your choice in it in 1 sentence.
+"""
+
+# -----------------------------------------------------------
+
+# Prompt for categorizing several emails in one request.
+# {emails} is a list of "### Email <index>" sections built by OllamaClient.
+
+BATCH_CATEGORIZE_PROMPT = """
+You are an intelligent email assistant. 
+Classify EACH of the emails below into EXACTLY one of these categories. 
+Prioritize 'Event' if the email describes a specific occurrence with a date and time.
+
+Categories:
+1. Event: A specific activity or meeting that takes place at a specific date and time. Must be something attendable (e.g., club meetings, hackathons, webinars, flights, interviews). NOT just a deadline.
+2. Important: Emails requiring direct action or containing crucial information (e.g., from boss/professors, bills, grades, legal/medical updates).
+3. Opportunity: Solicitations for jobs, scholarships, internships, or clubs. These may have 'deadlines' but are not 'events' you attend.
+4. Unimportant: Newsletters, promotional spam, social media notifications, or generic blasts.
+
+{emails}
+
+Provide your response in JSON format. 
+Return one entry in 'results' for EVERY email above, in order, with the email's 'index' 
+and the best matching 'category' from the list above.
+"""
+
+
 # -----------------------------------------------------------
 
 # Prompt for extracting event details
@@ -59,4 +107,39 @@ You are an intelligent calendar assistant. Your goal is to extract a specific, s
 
 ### EMAIL CONTENT
 {email_body}
-"""
\ No newline at end of file
+"""
+
+
+# -----------------------------------------------------------
+
+# Prompt for classifying an email and, only if it is an Event, extracting the
+# event in the same generation (saves a second pass over the same text)
+
+CLASSIFY_AND_EXTRACT_PROMPT = """
+You are an intelligent email and calendar assistant. 
+Analyze the following email body and classify it into EXACTLY one of these categories. 
+Prioritize 'Event' if the email describes a specific occurrence with a date and time.
+
+Categories:
+1. Event: A specific activity or meeting that takes place at a specific date and time. Must be something attendable (e.g., club meetings, hackathons, webinars, flights, interviews). NOT just a deadline.
+2. Important: Emails requiring direct action or containing crucial information (e.g., from boss/professors, bills, grades, legal/medical updates).
+3. Opportunity: Solicitations for jobs, scholarships, internships, or clubs. These may have 'deadlines' but are not 'events' you attend.
+4. Unimportant: Newsletters, promotional spam, social media notifications, or generic blasts.
+
+### CONTEXT
+- **Current Reference Date/Time:** {date_context} (Use this to resolve relative dates like "tomorrow" or "next Friday").
+
+### INSTRUCTIONS
+1. In the 'reasoning' field, explain your thought process in 1 sentence.
+2. In the 'category' field, select the best matching category from the list above.
+3. ONLY if the category is 'Event', also fill in the event fields:
+   - 'summary': a concise but descriptive title (3-7 words), not a generic one like "Meeting."
+   - 'start' / 'end': ISO 8601 date-times (YYYY-MM-DDTHH:MM:SS). If no end time or duration is mentioned, the end is exactly 1 hour after the start. They must NEVER be the same.
+   - 'description': the "Why" (Agenda) and "Who" (Participants), plus any location or video link.
+   - 'location': the location, if any.
+   For any other category, leave the event fields out.
+4. Output ONLY valid JSON with no markdown formatting.
+
+### EMAIL CONTENT
+{email_body}
+"""
@@ -0,0 +1,251 @@
+import os.path
+import json
+import time
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from src.config import CREDENTIALS_PATH, TOKEN_PATH, SCOPES, GOOGLE_API_ROOT_URL
+from src.ui.text_io import TextIO
+
+
+class AuthError(Exception):
+    """Raised when headless mode can't sign in without asking the user."""
+
+
+class CredentialManager:
+    """
+    Loads (and if needed refreshes) the Google credentials once per run and
+    builds API services from them, so Gmail and Calendar share one sign-in.
+
+    With interactive=False (headless runs) the account comes from `account`, or
+    the only saved one, and nothing ever waits on stdin or opens a browser.
+    Setting `creds` before the first get_credentials call skips sign-in entirely.
+    """
+
+    def __init__(self, ui=None, account=None, interactive=True, root_url=GOOGLE_API_ROOT_URL):
+        self.ui = ui or TextIO()
+        self.account = account
+        self.interactive = interactive
+        self.root_url = root_url
+        self.creds = None
+        self.account_email = None
+        # Seconds spent on each startup step, for tracking cold-start latency
+        self.timings = {"auth_seconds": 0.0, "discovery_seconds": 0.0}
+
+    def _load_saved_accounts(self):
+        """
+        Load all saved accounts from token.json.
+        Returns a list of account dictionaries with 'email' and 'token_data' keys.
+        """
+        if not os.path.exists(TOKEN_PATH):
+            return []
+        
+        try:
+            with open(TOKEN_PATH, 'r') as f:
+                data = json.load(f)
+            
+            # Handle both old single-account format and new multi-account format
+            if isinstance(data, dict) and 'accounts' in data:
+                # Multi-account format
+                return data['accounts']
+            elif isinstance(data, dict) and 'token' in data:
+                # Old single-account format - convert to new format
+                email = data.get('account', 'Unknown')
+                return [{'email': email if email else 'Unknown', 'token_data': data}]
+            else:
+                return []
+        except (json.JSONDecodeError, IOError):
+            return []
+
+    def _select_saved_account(self):
+        """
+        Display saved accounts and let user choose one.
+        Returns the selected account data or None if user wants a new account.
+        """
+        saved_accounts = self._load_saved_accounts()
+        
+        if not saved_accounts:
+            return None
+        
+        self.ui.show_str(f"Found {len(saved_accounts)} saved account(s).")
+        self.ui.show_str("\nSelect an account:")
+        for i, account in enumerate(saved_accounts, 1):
+            self.ui.show_str(f"  {i}. {account.get('email', 'Unknown')}")
+        self.ui.show_str(f"  {len(saved_accounts) + 1}. New account")
+        
+        while True:
+            try:
+                choice = int(input("\nEnter your choice (number): ").strip())
+                if 1 <= choice <= len(saved_accounts):
+                    selected_account = saved_accounts[choice - 1]
+                    try:
+                        self._load_account_credentials(selected_account)
+                        return selected_account
+                    except Exception as e:
+                        self.ui.show_str(f"Failed to load account: {e}. Please select another or create a new account.")
+                        return None
+                elif choice == len(saved_accounts) + 1:
+                    return None  # User wants a new account
+                else:
+                    self.ui.show_str("Invalid choice. Please try again.")
+            except ValueError:
+                self.ui.show_str("Please enter a valid number.")
+
+    def _select_configured_account(self):
+        """
+        Non-interactive version of _select_saved_account: uses the configured
+        account, or the only saved one if none is configured.
+        """
+        saved_accounts = self._load_saved_accounts()
+
+        if self.account:
+            matches = [a for a in saved_accounts if a.get('email') == self.account]
+            if not matches:
+                raise AuthError(f"Account {self.account} is not in {TOKEN_PATH}.")
+            selected_account = matches[0]
+        elif len(saved_accounts) == 1:
+            selected_account = saved_accounts[0]
+        else:
+            raise AuthError(
+                f"Found {len(saved_accounts)} saved accounts, pick one with --account "
+                "or GMAIL_AGENT_ACCOUNT."
+            )
+
+        self._load_account_credentials(selected_account)
+        return selected_account
+
+    def _load_account_credentials(self, account):
+        # Try to create credentials from saved token
+        self.creds = Credentials.from_authorized_user_info(
+            account['token_data'], SCOPES
+        )
+        # Refresh if expired
+        if self.creds.expired and self.creds.refresh_token:
+            self.creds.refresh(Request())
+
+    def _launch_browser_login(self):
+        """
+        Launch browser for OAuth login and return the new credentials.
+        """
+        self.ui.show_str("Launching browser for login...")
+        flow = InstalledAppFlow.from_client_secrets_file(
+            CREDENTIALS_PATH, SCOPES
+        )
+        
+        # prompt='select_account' forces Google to show the account picker
+        # even if you are already logged in to one account in Chrome.
+        self.creds = flow.run_local_server(
+            port=0, 
+            prompt='select_account'
+        )
+        
+        return self.creds
+
+    def _save_account(self, creds):
+        """
+        Save the account credentials to token.json in multi-account format.
+        """
+        try:
+            creds_data = json.loads(creds.to_json())
+            email = creds_data.get('account', 'Unknown')
+            
+            # Load existing accounts
+            if os.path.exists(TOKEN_PATH):
+                with open(TOKEN_PATH, 'r') as f:
+                    try:
+                        data = json.load(f)
+                        if 'accounts' in data:
+                            accounts = data['accounts']
+                        else:
+                            # Convert old format
+                            accounts = [{'email': data.get('account', 'Unknown'), 'token_data': data}]
+                    except json.JSONDecodeError:
+                        accounts = []
+            else:
+                accounts = []
+            
+            # Check if account already exists and update it
+            account_exists = False
+            for account in accounts:
+                if account.get('email') == email:
+                    account['token_data'] = creds_data
+                    account_exists = True
+                    break
+            
+            # If new account, add it
+            if not account_exists:
+                accounts.append({'email': email, 'token_data': creds_data})
+            
+            # Save to file
+            with open(TOKEN_PATH, 'w') as f:
+                json.dump({'accounts': accounts}, f, indent=2)
+            
+            self.ui.show_str(f"Account {email} saved successfully.")
+        except Exception as e:
+            self.ui.show_str(f"Warning: Failed to save account properly: {e}")
+
+    def authenticate(self):
+        """
+        Authenticate with Google (Gmail and Calendar share the same scopes).
+        Allows user to choose from saved accounts or create a new one.
+        """
+        start = time.perf_counter()
+
+        # 1. Try to load a saved account
+        if self.interactive:
+            selected_account = self._select_saved_account()
+        else:
+            selected_account = self._select_configured_account()
+        
+        # 2. If user selected a saved account and it worked, use it
+        if self.creds and self.creds.valid:
+            email = selected_account.get('email')
+            self.account_email = email if email and email != 'Unknown' else None
+            self.ui.show_str(f"Using account: {selected_account.get('email', 'Unknown')}\n")
+        elif not self.interactive:
+            raise AuthError("The saved token is no longer valid, sign in once without --headless.")
+        else:
+            # 3. Launch browser for new login
+            self._launch_browser_login()
+            self._save_account(self.creds)
+            self.account_email = json.loads(self.creds.to_json()).get('account')
+
+        self.timings["auth_seconds"] += time.perf_counter() - start
+        self.ui.show_str("Authentication successful!\n")
+
+    def get_credentials(self):
+        """Returns the credentials, signing in on the first call only."""
+        if self.creds is None or not self.creds.valid:
+            if self.creds and self.creds.expired and self.creds.refresh_token:
+                self.creds.refresh(Request())
+            else:
+                self.authenticate()
+        return self.creds
+
+    def build_service(self, name, version, http):
+        """
+        Builds an API service on the given (authorized) http object, from the
+        discovery document bundled with googleapiclient (no network fetch).
+        With a root_url every request goes there instead of googleapis.com
+        (e.g. the stand-in servers in benchmarks/fake_servers.py).
+        """
+        start = time.perf_counter()
+
+        if self.root_url:
+            # api_endpoint alone would leave batch requests going to googleapis.com,
+            # so point the whole document elsewhere
+            document = json.loads(get_static_doc(name, version))
+            root_url = self.root_url.rstrip('/') + '/'
+            document.update({
+                'rootUrl': root_url,
+                'mtlsRootUrl': root_url,
+                'baseUrl': root_url + document.get('servicePath', ''),
+            })
+            service = build_from_document(document, http=http)
+        else:
+            service = build(name, version, http=http, static_discovery=True)
+
+        self.timings["discovery_seconds"] += time.perf_counter() - start
+        return service
@@ -1,203 +1,331 @@
-import os.path
+import os
 import json
-from icalendar import Calendar
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from src.config import CREDENTIALS_PATH, TOKEN_PATH, SCOPES
+import threading
+import difflib
+from datetime import datetime, timedelta, timezone
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.errors import HttpError
+from src.services.auth import CredentialManager
+from src.services.scheduler import RequestScheduler
 from src.ui.text_io import TextIO, Constants
+from src.utils.event import CalendarEvent
+from src.utils.intervals import IntervalIndex
+from src.config import (
+    CALENDAR_BATCH_SIZE, CALENDAR_CACHE_PATH, CALENDAR_WINDOW_PAST_DAYS, CALENDAR_WINDOW_FUTURE_DAYS,
+    CALENDAR_RESYNC_DAYS, DUPLICATE_TIME_TOLERANCE_MINUTES, DUPLICATE_TITLE_RATIO
+)
 
 class GCalClient:
-    def __init__(self):
+    def __init__(self, auth=None, ui=None, scheduler=None, cache_path=CALENDAR_CACHE_PATH):
+        self.ui = ui or TextIO()
+        # Pass the same CredentialManager to every client to sign in only once
+        self.auth = auth or CredentialManager(self.ui)
+        # ...and the same RequestScheduler, so they share rate limits and backoff
+        self.scheduler = scheduler or RequestScheduler(self.ui)
         self.creds = None
         self.service = None
+        self._local = threading.local()
+        # Existing events in the checking window, loaded on the first check_event
+        self.cache_path = cache_path
+        self._index = None
+        self._index_lock = threading.Lock()
         self.authenticate()
 
-    def _load_saved_accounts(self):
+    def authenticate(self):
+        """Gets the shared credentials and builds the Calendar service."""
+        self.creds = self.auth.get_credentials()
+        self.service = self.auth.build_service(
+            'calendar', 'v3', http=AuthorizedHttp(self.creds, http=httplib2.Http())
+        )
+
+    def _thread_http(self):
         """
-        Load all saved accounts from token.json.
-        Returns a list of account dictionaries with 'email' and 'token_data' keys.
+        The calling thread's own authorized connection.
+        httplib2 is not thread-safe, so inserts from a worker pool can't share one.
         """
-        if not os.path.exists(TOKEN_PATH):
-            return []
-        
-        try:
-            with open(TOKEN_PATH, 'r') as f:
-                data = json.load(f)
-            
-            # Handle both old single-account format and new multi-account format
-            if isinstance(data, dict) and 'accounts' in data:
-                # Multi-account format
-                return data['accounts']
-            elif isinstance(data, dict) and 'token' in data:
-                # Old single-account format - convert to new format
-                email = data.get('account', 'Unknown')
-                return [{'email': email if email else 'Unknown', 'token_data': data}]
-            else:
-                return []
-        except (json.JSONDecodeError, IOError):
-            return []
+        if not hasattr(self._local, 'http'):
+            self._local.http = AuthorizedHttp(self.creds, http=httplib2.Http())
+        return self._local.http
 
-    def _select_saved_account(self):
+    def add_event(self, event):
         """
-        Display saved accounts and let user choose one.
-        Returns the selected account data or None if user wants a new account.
+        Adds a CalendarEvent to the user's primary calendar.
+        Returns the link to the created event.
         """
-        saved_accounts = self._load_saved_accounts()
-        
-        if not saved_accounts:
-            return None
-        
-        print(f"Found {len(saved_accounts)} saved account(s).")
-        print("\nSelect an account:")
-        for i, account in enumerate(saved_accounts, 1):
-            print(f"  {i}. {account.get('email', 'Unknown')}")
-        print(f"  {len(saved_accounts) + 1}. New account")
-        
-        while True:
-            try:
-                choice = int(input("\nEnter your choice (number): ").strip())
-                if 1 <= choice <= len(saved_accounts):
-                    selected_account = saved_accounts[choice - 1]
-                    try:
-                        # Try to create credentials from saved token
-                        self.creds = Credentials.from_authorized_user_info(
-                            selected_account['token_data'], SCOPES
-                        )
-                        # Refresh if expired
-                        if self.creds.expired and self.creds.refresh_token:
-                            self.creds.refresh(Request())
-                        return selected_account
-                    except Exception as e:
-                        print(f"Failed to load account: {e}. Please select another or create a new account.")
-                        return None
-                elif choice == len(saved_accounts) + 1:
-                    return None  # User wants a new account
-                else:
-                    print("Invalid choice. Please try again.")
-            except ValueError:
-                print("Please enter a valid number.")
+        result = self.add_events([event])[0]
+        if result['error']:
+            self.ui.show_error(f"Failed to add event to Google Calendar: {result['error']}")
+        return result['link']
 
-    def _launch_browser_login(self):
+    def add_events(self, events, http=None):
         """
-        Launch browser for OAuth login and return the new credentials.
+        Adds several CalendarEvents to the primary calendar through the batch
+        endpoint, in chunks of CALENDAR_BATCH_SIZE.
+        Events with a uid are imported under it (events().import_), which updates
+        the existing copy instead of adding a duplicate when the event is already
+        there, so re-runs are safe. Events without one are plain inserts.
+        Returns {'uid': ..., 'link': ..., 'error': ...} per event, in order.
         """
-        print("Launching browser for login...")
-        flow = InstalledAppFlow.from_client_secrets_file(
-            CREDENTIALS_PATH, SCOPES
-        )
-        
-        # prompt='select_account' forces Google to show the account picker
-        # even if you are already logged in to one account in Chrome.
-        self.creds = flow.run_local_server(
-            port=0, 
-            prompt='select_account'
-        )
-        
-        return self.creds
+        http = http or self._thread_http()
+        results = {}
 
-    def _save_account(self, creds):
+        def on_response(request_id, response, exception):
+            uid = events[int(request_id)].uid
+            if exception is not None:
+                results[request_id] = {"uid": uid, "link": None, "error": str(exception)}
+            else:
+                results[request_id] = {"uid": uid, "link": response.get('htmlLink'), "error": None}
+                # So a second email about the same event in this run is caught too
+                with self._index_lock:
+                    if self._index is not None:
+                        self._index_event(self._cached_event(response))
+
+        # The same event twice in one batch would be imported twice, send it once
+        first_index = {}
+        for index, event in enumerate(events):
+            first_index.setdefault(event.uid or index, index)
+        unique = list(first_index.values())
+
+        for start in range(0, len(unique), CALENDAR_BATCH_SIZE):
+            chunk = unique[start:start + CALENDAR_BATCH_SIZE]
+            requests = []
+            for index in chunk:
+                event = events[index]
+                if event.uid:
+                    request = self.service.events().import_(calendarId='primary', body=event.to_gcal_body())
+                else:
+                    request = self.service.events().insert(calendarId='primary', body=event.to_gcal_body())
+                requests.append((str(index), request))
+
+            try:
+                self.scheduler.execute_batch(
+                    self.service.new_batch_http_request, requests, on_response, http=http
+                )
+            except Exception as e:
+                # The whole chunk failed (e.g. network error), report it per event
+                for index in chunk:
+                    results.setdefault(
+                        str(index), {"uid": events[index].uid, "link": None, "error": str(e)}
+                    )
+
+        return [
+            results[str(first_index[event.uid or index])]
+            for index, event in enumerate(events)
+        ]
+
+    def check_event(self, event):
         """
-        Save the account credentials to token.json in multi-account format.
+        Compares an event with what is already on the primary calendar, answered
+        from the local window index (see _load_index), not with an API call.
+        Returns {'imported': ..., 'duplicate': ..., 'conflicts': [...]} where imported
+        (or None) is an earlier import of this very event (same uid), the duplicate
+        (or None) has the same time range and a similar title, and conflicts are the
+        other events it overlaps. All are cached event dicts (summary, start, end, link).
         """
-        try:
-            creds_data = json.loads(creds.to_json())
-            email = creds_data.get('account', 'Unknown')
-            
-            # Load existing accounts
-            if os.path.exists(TOKEN_PATH):
-                with open(TOKEN_PATH, 'r') as f:
-                    try:
-                        data = json.load(f)
-                        if 'accounts' in data:
-                            accounts = data['accounts']
-                        else:
-                            # Convert old format
-                            accounts = [{'email': data.get('account', 'Unknown'), 'token_data': data}]
-                    except json.JSONDecodeError:
-                        accounts = []
+        start, end = event.bounds()
+        with self._index_lock:
+            if self._index is None:
+                self._load_index()
+            overlapping = self._index.overlapping(start, end)
+
+        tolerance = timedelta(minutes=DUPLICATE_TIME_TOLERANCE_MINUTES)
+        title = event.summary.strip().lower()
+
+        imported = None
+        duplicate = None
+        conflicts = []
+        for existing in overlapping:
+            if event.uid and existing['uid'] == event.uid:
+                imported = existing
+                continue
+            same_time = (
+                abs(datetime.fromisoformat(existing['start']) - start) <= tolerance
+                and abs(datetime.fromisoformat(existing['end']) - end) <= tolerance
+            )
+            if duplicate is None and same_time and difflib.SequenceMatcher(
+                None, title, existing['summary'].strip().lower()
+            ).ratio() >= DUPLICATE_TITLE_RATIO:
+                duplicate = existing
             else:
-                accounts = []
-            
-            # Check if account already exists and update it
-            account_exists = False
-            for account in accounts:
-                if account.get('email') == email:
-                    account['token_data'] = creds_data
-                    account_exists = True
-                    break
-            
-            # If new account, add it
-            if not account_exists:
-                accounts.append({'email': email, 'token_data': creds_data})
-            
-            # Save to file
-            with open(TOKEN_PATH, 'w') as f:
-                json.dump({'accounts': accounts}, f, indent=2)
-            
-            print(f"Account {email} saved successfully.")
-        except Exception as e:
-            print(f"Warning: Failed to save account properly: {e}")
+                conflicts.append(existing)
 
-    def authenticate(self):
+        return {"imported": imported, "duplicate": duplicate, "conflicts": conflicts}
+
+    def _load_index(self):
         """
-        Authenticate with Google Calendar API.
-        Allows user to choose from saved accounts or create a new one.
+        Fills the interval index with the events in the checking window.
+        The first run lists the whole window; later runs only ask for what changed
+        since the saved syncToken, and a full reload happens when the token has
+        expired (410) or the window has moved on by CALENDAR_RESYNC_DAYS.
         """
-        # 1. Try to load a saved account
-        selected_account = self._select_saved_account()
-        
-        # 2. If user selected a saved account and it worked, use it
-        if self.creds and self.creds.valid:
-            print(f"Using account: {selected_account.get('email', 'Unknown')}\n")
-        else:
-            # 3. Launch browser for new login
-            self._launch_browser_login()
-            self._save_account(self.creds)
-        
-        # 4. Build the service
-        self.service = build('calendar', 'v3', credentials=self.creds)
-        print("Authentication successful!\n")
+        now = datetime.now(timezone.utc)
+        time_min = now - timedelta(days=CALENDAR_WINDOW_PAST_DAYS)
+        time_max = now + timedelta(days=CALENDAR_WINDOW_FUTURE_DAYS)
+
+        state = self._load_calendar_cache()
+        account = self.auth.account_email or 'default'
+        cached = state.get(account)
+
+        events = None
+        sync_token = None
+        if cached and datetime.fromisoformat(cached['time_max']) >= time_max - timedelta(days=CALENDAR_RESYNC_DAYS):
+            events = cached['events']
+            try:
+                changes, sync_token = self._list_events(syncToken=cached['sync_token'])
+            except HttpError as e:
+                # 410 means the token has expired, everything has to be listed again
+                if e.resp.status != 410:
+                    raise
+                events = None
+            else:
+                for change in changes:
+                    event = self._cached_event(change) if change.get('status') != 'cancelled' else None
+                    if event:
+                        events[change['id']] = event
+                    else:
+                        events.pop(change['id'], None)
+                time_min = datetime.fromisoformat(cached['time_min'])
+                time_max = datetime.fromisoformat(cached['time_max'])
+
+        if events is None:
+            items, sync_token = self._list_events(
+                timeMin=time_min.isoformat(), timeMax=time_max.isoformat()
+            )
+            events = {}
+            for item in items:
+                event = self._cached_event(item) if item.get('status') != 'cancelled' else None
+                if event:
+                    events[item['id']] = event
+
+        # Drop what slid out of the window, so the cache doesn't grow forever
+        cutoff = now - timedelta(days=CALENDAR_WINDOW_PAST_DAYS)
+        events = {
+            event_id: event for event_id, event in events.items()
+            if datetime.fromisoformat(event['end']) >= cutoff
+        }
+
+        self._index = IntervalIndex()
+        for event in events.values():
+            self._index_event(event)
+
+        if sync_token:
+            state[account] = {
+                "sync_token": sync_token,
+                "time_min": time_min.isoformat(),
+                "time_max": time_max.isoformat(),
+                "events": events,
+            }
+            try:
+                with open(self.cache_path, 'w') as f:
+                    json.dump(state, f)
+            except IOError as e:
+                self.ui.show_str(f"Warning: Failed to save the calendar cache: {e}")
+
+    def _list_events(self, **kwargs):
+        """Lists every page of primary calendar events. Returns (items, nextSyncToken)."""
+        items = []
+        page_token = None
+        http = self._thread_http()
+
+        while True:
+            response = self.scheduler.execute(
+                self.service.events().list(
+                    calendarId='primary',
+                    singleEvents=True,
+                    showDeleted=True,
+                    maxResults=2500,
+                    fields='items(id,status,summary,start,end,iCalUID,htmlLink),nextPageToken,nextSyncToken',
+                    pageToken=page_token,
+                    **kwargs
+                ),
+                http=http
+            )
+
+            items.extend(response.get('items', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return items, response.get('nextSyncToken')
+
+    def _cached_event(self, item):
+        """The parts of a Calendar event resource the index needs, or None without times."""
+        start = self._event_time(item.get('start'))
+        end = self._event_time(item.get('end'))
+        if start is None or end is None:
+            return None
+        return {
+            "id": item['id'],
+            "uid": item.get('iCalUID'),
+            "summary": item.get('summary', ''),
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "link": item.get('htmlLink'),
+        }
+
+    def _event_time(self, value):
+        if not value:
+            return None
+        if 'dateTime' in value:
+            # fromisoformat only takes a 'Z' suffix from Python 3.11 on
+            return datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+        if 'date' in value:
+            # All-day events run from local midnight
+            return datetime.fromisoformat(value['date']).astimezone()
+        return None
+
+    def _index_event(self, event):
+        # Callers hold _index_lock
+        if event is None:
+            return
+        self._index.add(
+            event['id'],
+            datetime.fromisoformat(event['start']),
+            datetime.fromisoformat(event['end']),
+            event
+        )
+
+    def _load_calendar_cache(self):
+        """Loads the {account email: cached window} calendar cache."""
+        if not os.path.exists(self.cache_path):
+            return {}
+
+        try:
+            with open(self.cache_path, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return {}
 
     def add_ics_event(self, ics_string):
         """
         Parses an ICS string and adds it to the user's primary calendar.
         Returns the link to the created event.
+        Extracted events don't go through ICS anymore, see add_event.
         """
-
-        ui = TextIO()
+        # Only needed for this path, so it isn't imported on every start
+        from icalendar import Calendar
 
         try:
             # 1. Parse the ICS string using the icalendar library
             cal = Calendar.from_ical(ics_string)
-            
+
             # We assume there is one event in the ICS string
             for component in cal.walk():
                 if component.name == "VEVENT":
-                    # 2. Map ICS fields to Google Calendar JSON Schema
-                    event_body = {
-                        'summary': str(component.get('summary')),
-                        'description': str(component.get('description', '')),
-                        'location': str(component.get('location', '')),
-                        'start': {
-                            'dateTime': component.get('dtstart').dt.isoformat(),
-                            'timeZone': 'UTC', # Our AI generates UTC times
-                        },
-                        'end': {
-                            'dateTime': component.get('dtend').dt.isoformat(),
-                            'timeZone': 'UTC',
-                        },
-                    }
-
+                    # 2. Map ICS fields to an event, keeping a real TZID if there is one
+                    start = component.get('dtstart')
+                    tzid = start.params.get('TZID')
+                    event = CalendarEvent(
+                        summary=str(component.get('summary')),
+                        start=start.dt,
+                        end=component.get('dtend').dt,
+                        description=str(component.get('description', '')),
+                        location=str(component.get('location', '')),
+                        # Our old exports wrote TZID=Local, which isn't a real zone
+                        time_zone=tzid if tzid and ('/' in tzid or tzid == 'UTC') else None
+                    )
                     # 3. Insert into Google Calendar
-                    created_event = self.service.events().insert(
-                        calendarId='primary', 
-                        body=event_body
-                    ).execute()
+                    return self.add_event(event)
 
-                    return created_event.get('htmlLink')
-                    
         except Exception as e:
-            ui.show_error(f"Failed to add event to Google Calendar: {e}")
-            return None
\ No newline at end of file
+            self.ui.show_error(f"Failed to add event to Google Calendar: {e}")
+            return None
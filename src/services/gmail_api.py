@@ -1,182 +1,516 @@
 import os.path
 import base64
 import json
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from src.config import CREDENTIALS_PATH, TOKEN_PATH, SCOPES
+import queue
+import threading
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.errors import HttpError
+from src.services.auth import CredentialManager
+from src.services.scheduler import RequestScheduler
+from src.ui.text_io import TextIO
+from src.config import (
+    GMAIL_BATCH_SIZE, GMAIL_PAGE_SIZE, GMAIL_PREFETCH_PAGES, SYNC_STATE_PATH, SYNC_MAX_RETRIES,
+    GMAIL_WRITE_BACK, PROCESSED_LABEL, GMAIL_MODIFY_BATCH_SIZE
+)
+
+# Partial-response masks: only ask Gmail for the parts of a message we read.
+# Three levels of nested parts covers multipart/mixed > alternative > text/plain.
+BODY_FIELDS = 'payload(mimeType,body/data,parts(mimeType,body/data,parts(mimeType,body/data,parts)))'
+FULL_FIELDS = 'id,labelIds,payload(headers,mimeType,body/data,parts(mimeType,body/data,parts(mimeType,body/data,parts)))'
+
+# Headers every metadata-only fetch asks for (what main.py reads); callers add
+# whatever else they need, e.g. the headers the loaded rules refer to
+METADATA_HEADERS = ['From', 'Subject', 'Date']
+
+# Mail the agent has already labelled as processed is left out of the listing
+UNREAD_QUERY = f'is:unread -label:{PROCESSED_LABEL}' if GMAIL_WRITE_BACK else 'is:unread'
+
+
+class _CountingHttp:
+    """Wraps an http object and reports the size of every response body."""
+
+    def __init__(self, http, on_bytes):
+        self._http = http
+        self._on_bytes = on_bytes
+
+    def request(self, *args, **kwargs):
+        response, content = self._http.request(*args, **kwargs)
+        self._on_bytes(len(content or b''))
+        return response, content
+
+    def __getattr__(self, name):
+        # Everything else (credentials, timeout, ...) comes from the wrapped object
+        return getattr(self._http, name)
+
 
 class GmailClient:
-    def __init__(self):
+    def __init__(self, auth=None, ui=None, scheduler=None):
+        self.ui = ui or TextIO()
+        # Pass the same CredentialManager to every client to sign in only once
+        self.auth = auth or CredentialManager(self.ui)
+        # ...and the same RequestScheduler, so they share rate limits and backoff
+        self.scheduler = scheduler or RequestScheduler(self.ui)
         self.creds = None
         self.service = None
+        self.account_email = None
+        self._pending_history_id = None
+        self._synced = False  # Whether iter_new_unread_emails ran, so there is a checkpoint to save
+        self._retries = {}  # Failed attempts so far of the messages being retried
+        self._deferred = []  # Ids listed past max_results, left for the next run
+        self._local = threading.local()
+        # Response bytes received from Gmail this run (after decompression)
+        self.bytes_fetched = 0
+        self._bytes_lock = threading.Lock()
+        # Label name (lowercased, Gmail compares them case-insensitively) -> id
+        self._label_ids = None
+        self._labels_lock = threading.Lock()
         self.authenticate()
 
-    def _load_saved_accounts(self):
+    def authenticate(self):
+        """Gets the shared credentials and builds the Gmail service."""
+        self.creds = self.auth.get_credentials()
+        self.account_email = self.auth.account_email
+        # Built on our own connection so every response is counted in bytes_fetched
+        self.service = self.auth.build_service('gmail', 'v1', http=self._new_http())
+
+    def get_unread_emails(self, limit=5):
+        """Fetches a list of message IDs for unread emails."""
+        return list(self.iter_unread_emails(max_results=limit, prefetch=0))
+
+    def iter_unread_emails(self, max_results=None, fetch_details=False, prefetch=GMAIL_PREFETCH_PAGES):
         """
-        Load all saved accounts from token.json.
-        Returns a list of account dictionaries with 'email' and 'token_data' keys.
+        Lazily yields unread messages, following nextPageToken until the mailbox
+        (or max_results) is exhausted.
+        Yields message stubs ({'id', 'threadId'}), or the dicts returned by
+        get_email_details_batch when fetch_details is True.
+        Up to `prefetch` pages are fetched ahead in a background thread, so memory
+        stays flat however large the backlog is. prefetch=0 fetches pages inline.
         """
-        if not os.path.exists(TOKEN_PATH):
-            return []
-        
-        try:
-            with open(TOKEN_PATH, 'r') as f:
-                data = json.load(f)
-            
-            # Handle both old single-account format and new multi-account format
-            if isinstance(data, dict) and 'accounts' in data:
-                # Multi-account format
-                return data['accounts']
-            elif isinstance(data, dict) and 'token' in data:
-                # Old single-account format - convert to new format
-                email = data.get('account', 'Unknown')
-                return [{'email': email if email else 'Unknown', 'token_data': data}]
-            else:
-                return []
-        except (json.JSONDecodeError, IOError):
-            return []
+        def make_pages(http):
+            return self._iter_unread_pages(max_results, fetch_details, http)
 
-    def _select_saved_account(self):
+        for page in self._iter_pages(make_pages, prefetch):
+            yield from page
+
+    def get_new_unread_emails(self, limit=5):
+        """List version of iter_new_unread_emails."""
+        return list(self.iter_new_unread_emails(max_results=limit, prefetch=0))
+
+    def iter_new_unread_emails(self, max_results=None, fetch_details=False, prefetch=GMAIL_PREFETCH_PAGES):
         """
-        Display saved accounts and let user choose one.
-        Returns the selected account data or None if user wants a new account.
+        Incremental version of iter_unread_emails.
+        Uses the historyId checkpoint saved for this account to yield only the unread
+        messages added since the last run. Falls back to a full listing when there is
+        no checkpoint yet or Gmail says it has expired.
+        Messages that failed last time (see save_sync_checkpoint) come first.
+        Messages cut off by max_results are left for the next run.
+        Call save_sync_checkpoint() once the yielded messages have been processed.
         """
-        saved_accounts = self._load_saved_accounts()
-        
-        if not saved_accounts:
-            return None
-        
-        print(f"Found {len(saved_accounts)} saved account(s).")
-        print("\nSelect an account:")
-        for i, account in enumerate(saved_accounts, 1):
-            print(f"  {i}. {account.get('email', 'Unknown')}")
-        print(f"  {len(saved_accounts) + 1}. New account")
-        
-        while True:
+        checkpoint = self._load_checkpoint()
+        start_history_id = checkpoint['history_id']
+        self._retries = checkpoint['retry']
+        self._deferred = []
+        self._synced = True
+        retry = [{'id': message_id, 'threadId': message_id} for message_id in self._retries]
+        messages = None
+
+        if start_history_id:
             try:
-                choice = int(input("\nEnter your choice (number): ").strip())
-                if 1 <= choice <= len(saved_accounts):
-                    selected_account = saved_accounts[choice - 1]
-                    try:
-                        # Try to create credentials from saved token
-                        self.creds = Credentials.from_authorized_user_info(
-                            selected_account['token_data'], SCOPES
-                        )
-                        # Refresh if expired
-                        if self.creds.expired and self.creds.refresh_token:
-                            self.creds.refresh(Request())
-                        return selected_account
-                    except Exception as e:
-                        print(f"Failed to load account: {e}. Please select another or create a new account.")
-                        return None
-                elif choice == len(saved_accounts) + 1:
-                    return None  # User wants a new account
-                else:
-                    print("Invalid choice. Please try again.")
-            except ValueError:
-                print("Please enter a valid number.")
-
-    def _launch_browser_login(self):
-        """
-        Launch browser for OAuth login and return the new credentials.
-        """
-        print("Launching browser for login...")
-        flow = InstalledAppFlow.from_client_secrets_file(
-            CREDENTIALS_PATH, SCOPES
-        )
-        
-        # prompt='select_account' forces Google to show the account picker
-        # even if you are already logged in to one account in Chrome.
-        self.creds = flow.run_local_server(
-            port=0, 
-            prompt='select_account'
-        )
-        
-        return self.creds
+                messages, latest_history_id = self._list_history(start_history_id)
+                self._pending_history_id = latest_history_id
+            except HttpError as e:
+                # 404 means the checkpoint is too old for Gmail to replay
+                if e.resp.status != 404:
+                    raise
+                self.ui.show_str("Sync checkpoint expired, falling back to a full sync.")
+
+        if messages is None:
+            # Take the checkpoint before listing so nothing that arrives meanwhile is lost,
+            # but only keep it once the listing has been read to the end
+            profile = self.scheduler.execute(self.service.users().getProfile(userId='me'))
+            history_id = profile.get('historyId')
+            self._pending_history_id = None
+
+            if max_results is not None:
+                self._deferred = [m['id'] for m in retry[max_results:]]
+                retry = retry[:max_results]
+            if fetch_details and retry:
+                retry = self.get_email_details_batch([m['id'] for m in retry])
+            yield from retry
+
+            remaining = None if max_results is None else max_results - len(retry)
+            if remaining is not None and remaining <= 0:
+                return
+            retried = {m['id'] for m in retry}
+
+            def make_pages(http):
+                complete = yield from self._iter_unread_pages(remaining, fetch_details, http)
+                if complete:
+                    self._pending_history_id = history_id
+
+            for page in self._iter_pages(make_pages, prefetch):
+                for message in page:
+                    if message['id'] not in retried:
+                        yield message
+            return
+
+        retried = {m['id'] for m in retry}
+        messages = retry + [m for m in messages if m['id'] not in retried]
+        if max_results is not None:
+            # The checkpoint moves past these, so they go on the retry list
+            self._deferred = [m['id'] for m in messages[max_results:]]
+            messages = messages[:max_results]
+
+        if not fetch_details:
+            yield from messages
+            return
+
+        def make_pages(http):
+            for start in range(0, len(messages), GMAIL_BATCH_SIZE):
+                chunk = messages[start:start + GMAIL_BATCH_SIZE]
+                yield self.get_email_details_batch([m['id'] for m in chunk], http=http)
+
+        for page in self._iter_pages(make_pages, prefetch):
+            yield from page
+
+    def _iter_unread_pages(self, max_results, fetch_details, http=None):
+        """
+        Yields one list of messages per listing page.
+        Returns True if it got to the last page, False if max_results cut it short.
+        """
+        remaining = max_results
+        page_token = None
+
+        while remaining is None or remaining > 0:
+            page_size = GMAIL_PAGE_SIZE if remaining is None else min(GMAIL_PAGE_SIZE, remaining)
+            response = self.scheduler.execute(
+                self.service.users().messages().list(
+                    userId='me',
+                    q=UNREAD_QUERY,
+                    maxResults=page_size,
+                    pageToken=page_token
+                ),
+                http=http
+            )
 
-    def _save_account(self, creds):
+            messages = response.get('messages', [])
+            if remaining is not None:
+                remaining -= len(messages)
+
+            if messages:
+                if fetch_details:
+                    messages = self.get_email_details_batch([m['id'] for m in messages], http=http)
+                yield messages
+
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        return not page_token
+
+    def _iter_pages(self, make_pages, prefetch):
         """
-        Save the account credentials to token.json in multi-account format.
+        Runs make_pages(http) inline, or in a background thread that stays at most
+        `prefetch` pages ahead of the consumer.
         """
+        if prefetch <= 0:
+            yield from make_pages(None)
+            return
+
+        pages = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            # Give up if the consumer went away, instead of blocking forever
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                # httplib2 is not thread-safe, so this thread gets its own connection
+                for page in make_pages(self._new_http()):
+                    if not put(page):
+                        return
+                put(done)
+            except Exception as e:
+                put(e)
+
+        threading.Thread(target=produce, daemon=True).start()
+
         try:
-            creds_data = json.loads(creds.to_json())
-            email = creds_data.get('account', 'Unknown')
-            
-            # Load existing accounts
-            if os.path.exists(TOKEN_PATH):
-                with open(TOKEN_PATH, 'r') as f:
-                    try:
-                        data = json.load(f)
-                        if 'accounts' in data:
-                            accounts = data['accounts']
-                        else:
-                            # Convert old format
-                            accounts = [{'email': data.get('account', 'Unknown'), 'token_data': data}]
-                    except json.JSONDecodeError:
-                        accounts = []
+            while True:
+                item = pages.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    def _new_http(self):
+        """An authorized HTTP connection that can be used from another thread."""
+        return _CountingHttp(AuthorizedHttp(self.creds, http=httplib2.Http()), self._count_bytes)
+
+    def _count_bytes(self, n):
+        with self._bytes_lock:
+            self.bytes_fetched += n
+
+    def _thread_http(self):
+        """The calling thread's own connection, so fetches can run from worker pools."""
+        if not hasattr(self._local, 'http'):
+            self._local.http = self._new_http()
+        return self._local.http
+
+    def save_sync_checkpoint(self, failed_ids=()):
+        """
+        Stores the historyId reached by the last get_new_unread_emails call, plus
+        the messages that failed to process: the next incremental run tries those
+        again, up to SYNC_MAX_RETRIES times, as the checkpoint has moved past them.
+        Messages left over by max_results go on the same list without counting as
+        a failed attempt.
+        """
+        if not self._synced:
+            return
+
+        retry = {message_id: self._retries.get(message_id, 0) for message_id in self._deferred}
+        for message_id in dict.fromkeys(failed_ids):
+            attempts = self._retries.get(message_id, 0) + 1
+            if attempts <= SYNC_MAX_RETRIES:
+                retry[message_id] = attempts
             else:
-                accounts = []
-            
-            # Check if account already exists and update it
-            account_exists = False
-            for account in accounts:
-                if account.get('email') == email:
-                    account['token_data'] = creds_data
-                    account_exists = True
-                    break
-            
-            # If new account, add it
-            if not account_exists:
-                accounts.append({'email': email, 'token_data': creds_data})
-            
-            # Save to file
-            with open(TOKEN_PATH, 'w') as f:
-                json.dump({'accounts': accounts}, f, indent=2)
-            
-            print(f"Account {email} saved successfully.")
-        except Exception as e:
-            print(f"Warning: Failed to save account properly: {e}")
+                self.ui.show_str(f"Giving up on email {message_id} after {attempts} failed attempts.")
 
-    def authenticate(self):
+        state = self._load_sync_state()
+        state[self._get_account_email()] = {'history_id': self._pending_history_id, 'retry': retry}
+
+        with open(SYNC_STATE_PATH, 'w') as f:
+            json.dump(state, f, indent=2)
+
+    def _list_history(self, start_history_id):
         """
-        Authenticate with Google Calendar API.
-        Allows user to choose from saved accounts or create a new one.
+        Lists unread messages added since start_history_id.
+        Returns (messages, latest_history_id).
         """
-        # 1. Try to load a saved account
-        selected_account = self._select_saved_account()
-        
-        # 2. If user selected a saved account and it worked, use it
-        if self.creds and self.creds.valid:
-            print(f"Using account: {selected_account.get('email', 'Unknown')}\n")
-        else:
-            # 3. Launch browser for new login
-            self._launch_browser_login()
-            self._save_account(self.creds)
-        
-        # 4. Build the service
-        self.service = build('gmail', 'v1', credentials=self.creds)
-        print("Authentication successful!\n")
+        messages = {}
+        latest_history_id = start_history_id
+        page_token = None
 
-    def get_unread_emails(self, limit=5):
-        """Fetches a list of message IDs for unread emails."""
-        results = self.service.users().messages().list(
-            userId='me', 
-            q='is:unread', 
-            maxResults=limit
-        ).execute()
-        
-        return results.get('messages', [])
+        while True:
+            response = self.scheduler.execute(
+                self.service.users().history().list(
+                    userId='me',
+                    startHistoryId=start_history_id,
+                    historyTypes=['messageAdded'],
+                    labelId='UNREAD',
+                    pageToken=page_token
+                )
+            )
+
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message = added['message']
+                    if 'UNREAD' in message.get('labelIds', []):
+                        messages[message['id']] = message
+
+            latest_history_id = response.get('historyId', latest_history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        return list(messages.values()), latest_history_id
+
+    def get_or_create_label(self, name):
+        """The id of the label called `name`, created if the mailbox doesn't have it yet."""
+        with self._labels_lock:
+            if self._label_ids is None:
+                self._label_ids = self._list_labels()
+
+            if name.lower() not in self._label_ids:
+                try:
+                    label = self.scheduler.execute(
+                        self.service.users().labels().create(
+                            userId='me',
+                            body={
+                                'name': name,
+                                'labelListVisibility': 'labelShow',
+                                'messageListVisibility': 'show'
+                            }
+                        ),
+                        http=self._thread_http()
+                    )
+                    self._label_ids[name.lower()] = label['id']
+                except HttpError as e:
+                    # 409 means it exists after all (created since we listed)
+                    if e.resp.status != 409:
+                        raise
+                    self._label_ids = self._list_labels()
+
+            return self._label_ids[name.lower()]
+
+    def label_emails(self, message_ids, label_names):
+        """
+        Adds the labels called label_names (created on demand) to every message,
+        with one batchModify request per GMAIL_MODIFY_BATCH_SIZE ids.
+        """
+        label_ids = [self.get_or_create_label(name) for name in label_names]
+        message_ids = list(dict.fromkeys(message_ids))
+
+        for start in range(0, len(message_ids), GMAIL_MODIFY_BATCH_SIZE):
+            self.scheduler.execute(
+                self.service.users().messages().batchModify(
+                    userId='me',
+                    body={
+                        'ids': message_ids[start:start + GMAIL_MODIFY_BATCH_SIZE],
+                        'addLabelIds': label_ids
+                    }
+                ),
+                http=self._thread_http()
+            )
+
+    def _list_labels(self):
+        response = self.scheduler.execute(
+            self.service.users().labels().list(userId='me'), http=self._thread_http()
+        )
+        return {label['name'].lower(): label['id'] for label in response.get('labels', [])}
+
+    def _get_account_email(self):
+        """The address of the authenticated account, used to key sync checkpoints."""
+        if self.account_email is None:
+            profile = self.scheduler.execute(self.service.users().getProfile(userId='me'))
+            self.account_email = profile['emailAddress']
+        return self.account_email
+
+    def _load_checkpoint(self):
+        """This account's {'history_id', 'retry': {message id: failed attempts}}."""
+        checkpoint = self._load_sync_state().get(self._get_account_email())
+        if not isinstance(checkpoint, dict):
+            # Older state files hold just the historyId
+            checkpoint = {'history_id': checkpoint}
+        return {'history_id': checkpoint.get('history_id'), 'retry': checkpoint.get('retry') or {}}
+
+    def _load_sync_state(self):
+        """Loads the {account email: checkpoint} state (see _load_checkpoint)."""
+        if not os.path.exists(SYNC_STATE_PATH):
+            return {}
+
+        try:
+            with open(SYNC_STATE_PATH, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return {}
 
     def get_email_details(self, message_id):
         """Fetches and parses a specific email."""
-        msg = self.service.users().messages().get(
-            userId='me', 
-            id=message_id, 
-            format='full'
-        ).execute()
+        msg = self.scheduler.execute(
+            self.service.users().messages().get(
+                userId='me',
+                id=message_id,
+                format='full',
+                fields=FULL_FIELDS
+            ),
+            http=self._thread_http()
+        )
+
+        return self._build_email_data(message_id, msg)
+
+    def get_email_details_batch(self, message_ids, http=None):
+        """
+        Fetches and parses several emails through the Gmail batch endpoint.
+        Returns a list in the same order as message_ids. Each entry has the same
+        shape as get_email_details, or {'id': ..., 'error': ...} if that message
+        could not be fetched.
+        """
+        return self._batch_get(
+            message_ids,
+            {'format': 'full', 'fields': FULL_FIELDS},
+            self._build_email_data,
+            http
+        )
+
+    def get_email_metadata_batch(self, message_ids, headers=(), http=None):
+        """
+        Like get_email_details_batch, but only fetches the labels and headers needed
+        for triage (format='metadata'): METADATA_HEADERS plus `headers`. 'body' is
+        None; use get_email_bodies_batch for the emails that actually need one.
+        """
+        # Header names are case-insensitive, ask for each one once
+        wanted = {}
+        for name in [*METADATA_HEADERS, *headers]:
+            wanted.setdefault(name.lower(), name)
+
+        return self._batch_get(
+            message_ids,
+            {
+                'format': 'metadata',
+                'metadataHeaders': list(wanted.values()),
+                'fields': 'id,labelIds,payload/headers'
+            },
+            self._build_email_data,
+            http
+        )
+
+    def get_email_bodies_batch(self, message_ids, http=None):
+        """
+        Fetches just the text body of several emails.
+        Returns a list of {'id', 'body'} (or {'id', 'error'}) in message_ids order.
+        """
+        return self._batch_get(
+            message_ids,
+            {'format': 'full', 'fields': BODY_FIELDS},
+            lambda message_id, msg: {
+                "id": message_id,
+                "body": self._parse_body(msg.get('payload', {}))
+            },
+            http
+        )
+
+    def _batch_get(self, message_ids, get_kwargs, build_result, http=None):
+        """
+        Runs messages().get(**get_kwargs) for every id through the batch endpoint,
+        in chunks of GMAIL_BATCH_SIZE, and maps each response with build_result.
+        Failed messages come back as {'id': ..., 'error': ...}.
+        """
+        http = http or self._thread_http()
+        results = {}
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                results[request_id] = {"id": request_id, "error": str(exception)}
+            else:
+                results[request_id] = build_result(request_id, response)
+
+        # Batch request ids must be unique, so drop duplicates but keep the order
+        unique_ids = list(dict.fromkeys(message_ids))
+
+        for start in range(0, len(unique_ids), GMAIL_BATCH_SIZE):
+            chunk = unique_ids[start:start + GMAIL_BATCH_SIZE]
+            requests = [
+                (message_id, self.service.users().messages().get(userId='me', id=message_id, **get_kwargs))
+                for message_id in chunk
+            ]
+
+            try:
+                # Items that get throttled are retried by the scheduler on their own
+                self.scheduler.execute_batch(
+                    self.service.new_batch_http_request, requests, on_response, http=http
+                )
+            except Exception as e:
+                # The whole chunk failed (e.g. network error), report it per message
+                for message_id in chunk:
+                    results.setdefault(message_id, {"id": message_id, "error": str(e)})
+
+        return [results[message_id] for message_id in message_ids]
 
+    def _build_email_data(self, message_id, msg):
+        """Turns a raw Gmail message resource into our email dict."""
         payload = msg.get('payload', {})
         headers = payload.get('headers', [])
 
@@ -185,7 +519,12 @@ class GmailClient:
             "sender": self._extract_header(headers, "From"),
             "subject": self._extract_header(headers, "Subject"),
             "date": self._extract_header(headers, "Date"),  
-            "body": self._parse_body(payload)
+            # Metadata-only fetches have no body parts at all
+            "body": self._parse_body(payload) if 'parts' in payload or 'body' in payload else None,
+            # Everything else, for the rule-based pre-classifier
+            # (header names lowercased since they are case-insensitive)
+            "headers": {header['name'].lower(): header['value'] for header in headers},
+            "labels": msg.get('labelIds', [])
         }
         return email_data
 
@@ -205,7 +544,8 @@ class GmailClient:
             for part in payload['parts']:
                 mime_type = part.get('mimeType')
                 if mime_type == 'text/plain':
-                    if 'data' in part['body']:
+                    # With a field mask, 'body' is left out entirely when it has no data
+                    if 'data' in part.get('body', {}):
                         return self._decode_base64(part['body']['data'])
                 if 'parts' in part:
                     return self._parse_body(part)
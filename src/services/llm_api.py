@@ -1,40 +1,118 @@
 import ollama
 import os
+import re
 import json
-import uuid
+import threading
+import time
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from src.prompts import CATEGORIZE_PROMPT, EVENT_EXTRACTION_PROMPT
+from src.prompts import (
+    CATEGORIZE_PROMPT, STREAM_CATEGORIZE_PROMPT, BATCH_CATEGORIZE_PROMPT, EVENT_EXTRACTION_PROMPT,
+    CLASSIFY_AND_EXTRACT_PROMPT
+)
 from src.ui.text_io import TextIO, Constants
+from src.utils.cache import LLMCache
+from src.utils.condenser import estimate_tokens, fit_to_budget
+from src.utils.event import CalendarEvent
+from src.utils.metrics import NullMetrics
+from src.config import (
+    LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_AGE_DAYS,
+    OLLAMA_NUM_CTX, CLASSIFY_BATCH_SIZE, CLASSIFY_TOKEN_BUDGET, CLASSIFY_BATCH_TOKEN_BUDGET,
+    EXTRACT_TOKEN_BUDGET, COMBINED_TOKEN_BUDGET, OLLAMA_CTX_BUCKETS, NUM_PREDICT,
+    FAST_MODE, REASONING_MAX_CHARS, LOCAL_TIMEZONE, STREAM_CLASSIFICATION, DEBUG_MODE
+)
 
 load_dotenv()
 
 MODEL = os.getenv("OLLAMA_MODEL", "phi3")
+HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "300"))
+# How long Ollama keeps the model in memory after our last request
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+CATEGORIES = ["Important", "Event", "Opportunity", "Unimportant"]
+
+# A complete "category" value in a (possibly unfinished) streamed JSON answer
+CATEGORY_PATTERN = re.compile(r'"category"\s*:\s*"([^"]*)"')
 
 class OllamaClient:
-    def __init__(self):
+    def __init__(self, warm_up=False, ui=None, host=None, cache=True, metrics=None):
+        self.ui = ui or TextIO()
+        self.metrics = metrics or NullMetrics()
+        # One client for the whole run, so requests reuse its pooled HTTP connection
+        self.client = ollama.Client(host=host or HOST, timeout=TIMEOUT)
+
+        # Seconds spent loading the model vs. actually generating, as Ollama reports them
+        self.timings = {"calls": 0, "load_seconds": 0.0, "inference_seconds": 0.0}
+        self._timings_lock = threading.Lock()
+
+        if warm_up:
+            # Load the model in the background (e.g. while Gmail auth is running)
+            threading.Thread(target=self._warm_up, daemon=True).start()
+
         self.category_schema = {
             "type": "object",
             "properties": {
                 "reasoning": {
                     "type": "string",
-                    "description": "A brief explanation of why this category fits."
+                    "description": "A brief explanation of why this category fits.",
+                    "maxLength": REASONING_MAX_CHARS
                 },
                 "category": {
                     "type": "string",
-                    "enum": ["Important", "Event", "Opportunity", "Unimportant"]
+                    "enum": CATEGORIES
                 }
             },
             "required": ["reasoning", "category"] 
         }
 
+        # Streaming classification: category first, so it can be read before the
+        # rest is generated. Reasoning only when there's a debug log to print it to.
+        self.stream_category_schema = {
+            "type": "object",
+            "properties": {
+                "category": {
+                    "type": "string",
+                    "enum": CATEGORIES
+                }
+            },
+            "required": ["category"]
+        }
+        if DEBUG_MODE and not FAST_MODE:
+            self.stream_category_schema['properties']['reasoning'] = {
+                **self.category_schema['properties']['reasoning']
+            }
+
+        # Schema for classifying several emails at once, one result per email index
+        self.batch_category_schema = {
+            "type": "object",
+            "properties": {
+                "results": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "index": {"type": "integer"},
+                            "category": {
+                                "type": "string",
+                                "enum": CATEGORIES
+                            }
+                        },
+                        "required": ["index", "category"]
+                    }
+                }
+            },
+            "required": ["results"]
+        }
+
         # Schema for Event Extraction (Strict typing)
         self.event_schema = {
             "type": "object",
             "properties": {
                 "reasoning": {
                     "type": "string",
-                    "description": "A brief explanation of the event details extracted."
+                    "description": "A brief explanation of the event details extracted.",
+                    "maxLength": REASONING_MAX_CHARS
                 },
                 "summary": {"type": "string"},
                 "description": {"type": "string"},
@@ -59,35 +137,349 @@ class OllamaClient:
             "required": ["reasoning", "summary", "start", "end", "description"]
         }
 
-    def categorize_email(self, email_body):
-        clean_body = email_body[:3000]
-        
-        prompt = CATEGORIZE_PROMPT.format(email_body=clean_body)
+        # Schema for the single-pass mode: only the category is required, the event
+        # fields are filled in when the category is Event.
+        event_fields = {
+            name: spec for name, spec in self.event_schema['properties'].items()
+            if name != 'reasoning'
+        }
+        self.combined_schema = {
+            "type": "object",
+            "properties": {
+                **self.category_schema['properties'],
+                **event_fields
+            },
+            "required": ["reasoning", "category"]
+        }
 
+        # Fast mode: no reasoning at all, the model goes straight to the answer
+        if FAST_MODE:
+            for schema in (self.category_schema, self.event_schema, self.combined_schema):
+                schema['properties'].pop('reasoning', None)
+                schema['required'] = [name for name in schema['required'] if name != 'reasoning']
+
+        # Results are keyed on the model, prompt and schema too, so changing any of
+        # them automatically stops us from serving stale answers.
+        self.cache = None
+        if cache and LLM_CACHE_ENABLED:
+            category_prompt, category_schema = (
+                (STREAM_CATEGORIZE_PROMPT, self.stream_category_schema) if STREAM_CLASSIFICATION
+                else (CATEGORIZE_PROMPT, self.category_schema)
+            )
+            self.cache = LLMCache(
+                LLM_CACHE_PATH,
+                {
+                    'category': LLMCache.make_fingerprint(MODEL, category_prompt, category_schema),
+                    'category_batch': LLMCache.make_fingerprint(
+                        MODEL, BATCH_CATEGORIZE_PROMPT, self.batch_category_schema
+                    ),
+                    'event': LLMCache.make_fingerprint(MODEL, EVENT_EXTRACTION_PROMPT, self.event_schema),
+                    'combined': LLMCache.make_fingerprint(
+                        MODEL, CLASSIFY_AND_EXTRACT_PROMPT, self.combined_schema
+                    ),
+                },
+                max_entries=LLM_CACHE_MAX_ENTRIES,
+                max_age_days=LLM_CACHE_MAX_AGE_DAYS
+            )
+
+    def _warm_up(self):
+        """An empty generate request makes Ollama load the model and keep it loaded."""
         try:
-            response = ollama.chat(
-                model=MODEL,
-                messages=[{'role': 'user', 'content': prompt}],
-                format=self.category_schema,
-                options={'temperature': 0} # Keep 0 for consistency
+            response = self.client.generate(model=MODEL, prompt='', keep_alive=KEEP_ALIVE)
+            self._record_timings(response, 'warm_up')
+        except Exception as e:
+            self.ui.show_error(f"LLM warm-up failed: {e}")
+
+    def _chat(self, prompt, schema, options, num_predict, task, stream=False):
+        """
+        Sends one structured-output chat request through the shared client.
+        The context window is sized to the prompt plus num_predict, rounded up to
+        one of OLLAMA_CTX_BUCKETS so Ollama isn't reallocating the KV cache for
+        every slightly different length.
+        With stream=True, returns the iterator of response chunks instead and
+        leaves recording the timings to the caller.
+        """
+        needed = estimate_tokens(prompt) + num_predict
+        num_ctx = next(
+            (bucket for bucket in OLLAMA_CTX_BUCKETS if bucket >= needed),
+            OLLAMA_CTX_BUCKETS[-1]
+        )
+
+        response = self.client.chat(
+            model=MODEL,
+            messages=[{'role': 'user', 'content': prompt}],
+            format=schema,
+            options={**options, 'num_ctx': num_ctx, 'num_predict': num_predict},
+            keep_alive=KEEP_ALIVE,
+            stream=stream
+        )
+        if not stream:
+            self._record_timings(response, task)
+        return response
+
+    def _stream_category(self, prompt):
+        """
+        Streams a STREAM_CATEGORIZE_PROMPT answer and returns its parsed JSON.
+        Without a reasoning field to wait for, the stream is closed as soon as
+        a valid category is complete, which makes Ollama stop generating.
+        """
+        start = time.perf_counter()
+        chunks = self._chat(
+            prompt,
+            schema=self.stream_category_schema,
+            options={'temperature': 0},
+            num_predict=NUM_PREDICT['category'],
+            task='category',
+            stream=True
+        )
+        wants_reasoning = 'reasoning' in self.stream_category_schema['properties']
+
+        content = ""
+        generated = 0
+        category = None
+        final = None
+        try:
+            for chunk in chunks:
+                content += chunk['message']['content']
+                generated += 1
+                if chunk.get('done'):
+                    final = chunk
+                    break
+
+                match = CATEGORY_PATTERN.search(content)
+                if match and match.group(1) in CATEGORIES:
+                    category = match.group(1)
+                    if not wants_reasoning:
+                        break
+        finally:
+            # Hangs up on Ollama if it is still generating
+            chunks.close()
+
+        if final is not None:
+            self._record_timings(final, 'category')
+        else:
+            # Cut short, so Ollama sent no totals: each chunk is one generated token
+            self._record_timings(
+                {'eval_count': generated, 'total_duration': (time.perf_counter() - start) * 1e9},
+                'category'
             )
-            
-            response_json = json.loads(response['message']['content'])
+
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
+            if category is None:
+                raise
+            # Stopped early (or the reasoning ran past num_predict), the category is all we need
+            return {'category': category}
+
+    def _record_timings(self, response, task):
+        self.metrics.record_llm(response, task)
+        # Ollama reports durations in nanoseconds; load_duration is the cold-start part
+        load = (response.get('load_duration') or 0) / 1e9
+        total = (response.get('total_duration') or 0) / 1e9
+        with self._timings_lock:
+            self.timings["calls"] += 1
+            self.timings["load_seconds"] += load
+            self.timings["inference_seconds"] += max(total - load, 0.0)
+
+    def categorize_email(self, email_body):
+        """Returns the email's category, or None if the LLM call failed (nothing is cached then)."""
+        clean_body = fit_to_budget(email_body, CLASSIFY_TOKEN_BUDGET)
+
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key('category', clean_body)
+            cached = self.cache.get(cache_key)
+            if cached:
+                return cached
+
+        try:
+            if STREAM_CLASSIFICATION:
+                response_json = self._stream_category(STREAM_CATEGORIZE_PROMPT.format(email_body=clean_body))
+            else:
+                response = self._chat(
+                    CATEGORIZE_PROMPT.format(email_body=clean_body),
+                    schema=self.category_schema,
+                    options={'temperature': 0}, # Keep 0 for consistency
+                    num_predict=NUM_PREDICT['category'],
+                    task='category'
+                )
+                response_json = json.loads(response['message']['content'])
             
             # Debugging: Print the reasoning to see why it's failing
-            print(f"Reasoning: {response_json.get('reasoning')}")
-            print(f"Category: {response_json.get('category')}")
+            self.ui.show_debug(f"Reasoning: {response_json.get('reasoning')}")
+            self.ui.show_debug(f"Category: {response_json.get('category')}")
 
-            return response_json['category']
+            category = response_json['category']
+            if category not in CATEGORIES:
+                raise ValueError(f"unknown category {category!r}")
+            if cache_key:
+                self.cache.set('category', cache_key, category)
+
+            return category
             
         except Exception as e:
-            print(f"LLM Error (Category): {e}")
-            return "Unimportant"
+            self.ui.show_error(f"LLM Error (Category): {e}")
+            return None
+
+    def categorize_emails(self, email_bodies):
+        """
+        Categorizes several emails, packing as many as fit in the context window
+        (up to CLASSIFY_BATCH_SIZE) into each LLM call.
+        Returns a list of categories in the same order as email_bodies, with None
+        for emails the LLM failed on (those are not cached).
+        """
+        clean_bodies = [fit_to_budget(body, CLASSIFY_BATCH_TOKEN_BUDGET) for body in email_bodies]
+        categories = [None] * len(clean_bodies)
+        cache_keys = [None] * len(clean_bodies)
+
+        if self.cache:
+            for i, body in enumerate(clean_bodies):
+                cache_keys[i] = self.cache.make_key('category_batch', body)
+                categories[i] = self.cache.get(cache_keys[i])
+
+        pending = [i for i, category in enumerate(categories) if category is None]
+
+        for batch in self._pack_batches(pending, clean_bodies):
+            results = self._categorize_batch([clean_bodies[i] for i in batch])
+            for i, category in zip(batch, results):
+                categories[i] = category
+                if cache_keys[i] and category is not None:
+                    self.cache.set('category_batch', cache_keys[i], category)
+
+        return categories
+
+    def _pack_batches(self, indices, bodies):
+        """
+        Greedily groups email indices so each group's prompt fits in OLLAMA_NUM_CTX.
+        Emails are already truncated, so a lone email always fits.
+        """
+        overhead = estimate_tokens(BATCH_CATEGORIZE_PROMPT)
+        # Each result costs this many output tokens ({"index": n, "category": ...})
+        per_result = NUM_PREDICT['category_batch']
+        budget = OLLAMA_NUM_CTX - overhead
+
+        batches = []
+        current = []
+        used = 0
+        for i in indices:
+            cost = estimate_tokens(bodies[i]) + per_result
+            if current and (used + cost > budget or len(current) >= CLASSIFY_BATCH_SIZE):
+                batches.append(current)
+                current = []
+                used = 0
+            current.append(i)
+            used += cost
+
+        if current:
+            batches.append(current)
+        return batches
+
+    def _categorize_batch(self, bodies):
+        """
+        Classifies a packed batch in one call. If the model returns malformed JSON
+        or misses any email, the batch is split in half and each half retried;
+        a single email falls back to categorize_email.
+        """
+        if len(bodies) == 1:
+            return [self.categorize_email(bodies[0])]
+
+        sections = "\n\n".join(
+            f"### Email {index}\n\"{body}\"" for index, body in enumerate(bodies, 1)
+        )
+        prompt = BATCH_CATEGORIZE_PROMPT.format(emails=sections)
+
+        try:
+            response = self._chat(
+                prompt,
+                schema=self.batch_category_schema,
+                options={'temperature': 0},
+                # Plus a little for the {"results": [...]} wrapper
+                num_predict=NUM_PREDICT['category_batch'] * len(bodies) + 16,
+                task='category_batch'
+            )
+
+            results = json.loads(response['message']['content'])['results']
+            by_index = {
+                r['index']: r['category'] for r in results
+                if r.get('category') in CATEGORIES
+            }
+            if all(index in by_index for index in range(1, len(bodies) + 1)):
+                return [by_index[index] for index in range(1, len(bodies) + 1)]
+
+            self.ui.show_debug(f"LLM returned {len(by_index)}/{len(bodies)} categories, splitting the batch.")
+
+        except Exception as e:
+            self.ui.show_debug(f"LLM Error (Batch category): {e}, splitting the batch.")
+
+        middle = len(bodies) // 2
+        return self._categorize_batch(bodies[:middle]) + self._categorize_batch(bodies[middle:])
         
-    def create_event(self, email_body, email_date_str=None):
-        ui = TextIO()
+    def categorize_and_extract(self, email_body, email_date_str=None):
+        """
+        Classifies an email and, if it is an Event, extracts the event in the same
+        LLM call. Returns (category, CalendarEvent or None), or (None, None) if the
+        LLM call failed. Falls back to create_event if the model says Event but leaves out fields.
+        """
+        clean_body = fit_to_budget(email_body, COMBINED_TOKEN_BUDGET)
+        date_str = email_date_str if email_date_str else datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key('combined', clean_body, date_str)
+            cached = self.cache.get(cache_key)
+            if cached:
+                event_data = cached.get('event')
+                return cached['category'], self._to_event(event_data) if event_data else None
 
-        clean_body = email_body[:8000]
+        prompt = CLASSIFY_AND_EXTRACT_PROMPT.format(
+            date_context=date_str,
+            email_body=clean_body
+        )
+
+        try:
+            response = self._chat(
+                prompt,
+                schema=self.combined_schema,
+                options={'temperature': 0},
+                num_predict=NUM_PREDICT['combined'],
+                task='combined'
+            )
+
+            response_json = json.loads(response['message']['content'])
+            category = response_json['category']
+            if category not in CATEGORIES:
+                raise ValueError(f"unknown category {category!r}")
+
+            self.ui.show_debug(f"Reasoning: {response_json.get('reasoning')}")
+            self.ui.show_debug(f"Category: {category}")
+
+        except Exception as e:
+            self.ui.show_error(f"LLM Error (Category + Event): {e}")
+            return None, None
+
+        event_data = None
+        if category == "Event":
+            has_times = all(
+                isinstance(response_json.get(key), dict) and response_json[key].get('dateTime')
+                for key in ('start', 'end')
+            )
+            if not (has_times and response_json.get('summary')):
+                # Classification is still good, only the extraction needs a second pass
+                return category, self.create_event(email_body, email_date_str)
+
+            event_data = self._validate_and_fix_event_data({
+                key: value for key, value in response_json.items() if key != 'category'
+            })
+
+        if cache_key:
+            self.cache.set('combined', cache_key, {'category': category, 'event': event_data})
+
+        return category, self._to_event(event_data) if event_data else None
+
+    def create_event(self, email_body, email_date_str=None):
+        """Extracts the event described in an email. Returns a CalendarEvent or None."""
+        clean_body = fit_to_budget(email_body, EXTRACT_TOKEN_BUDGET)
         date_str = email_date_str if email_date_str else datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         prompt = EVENT_EXTRACTION_PROMPT.format(
@@ -95,25 +487,36 @@ class OllamaClient:
             email_body=clean_body
         )
 
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key('event', clean_body, date_str)
+            cached = self.cache.get(cache_key)
+            if cached:
+                return self._to_event(cached)
+
         try:
-            response = ollama.chat(
-                model=MODEL,
-                messages=[{'role': 'user', 'content': prompt}],
-                format=self.event_schema, 
-                options={'temperature': 0.1} 
+            response = self._chat(
+                prompt,
+                schema=self.event_schema,
+                options={'temperature': 0.1},
+                num_predict=NUM_PREDICT['event'],
+                task='event'
             )
             
             raw_json = response['message']['content']
             event_data = json.loads(raw_json)
             
             validated_data = self._validate_and_fix_event_data(event_data)
-            return self._generate_ics_string(validated_data)
+            if cache_key:
+                self.cache.set('event', cache_key, validated_data)
+
+            return self._to_event(validated_data)
 
         except json.JSONDecodeError:
-            ui.show_error("LLM failed to produce valid JSON.")
+            self.ui.show_error("LLM failed to produce valid JSON.")
             return None
         except Exception as e:
-            ui.show_error(f"LLM event error: {e}")
+            self.ui.show_error(f"LLM event error: {e}")
             return None
 
     def _validate_and_fix_event_data(self, data):
@@ -122,13 +525,23 @@ class OllamaClient:
             start_dt = datetime.fromisoformat(data['start']['dateTime'])
             end_dt = datetime.fromisoformat(data['end']['dateTime'])
 
+            # The model sometimes gives only one of them an offset; they can't be
+            # compared like that, so the other one is read in the same zone
+            if (start_dt.tzinfo is None) != (end_dt.tzinfo is None):
+                if start_dt.tzinfo is None:
+                    start_dt = start_dt.replace(tzinfo=end_dt.tzinfo)
+                    data['start']['dateTime'] = start_dt.isoformat()
+                else:
+                    end_dt = end_dt.replace(tzinfo=start_dt.tzinfo)
+                    data['end']['dateTime'] = end_dt.isoformat()
+
             # Guardrail: If End is before or same as Start, fix it.
             if end_dt <= start_dt:
                 end_dt = start_dt + timedelta(hours=1)
                 # Update the data dictionary with the fixed time
                 data['end']['dateTime'] = end_dt.isoformat()
 
-        except (ValueError, KeyError):
+        except (ValueError, KeyError, TypeError):
             # Fallback: If parsing fails entirely, create a "now" event
             now = datetime.now()
             data['start']['dateTime'] = now.isoformat()
@@ -140,38 +553,6 @@ class OllamaClient:
             
         return data
 
-    def _generate_ics_string(self, data):
-        def to_ics_format(iso_str):
-            # Converts ISO 8601 (2023-10-27T14:00:00) to ICS format (20231027T140000)
-            dt = datetime.fromisoformat(iso_str)
-            return dt.strftime('%Y%m%dT%H%M%S')
-
-        # Use helper to format dates safely
-        start_str = to_ics_format(data['start']['dateTime'])
-        end_str = to_ics_format(data['end']['dateTime'])
-        
-        now_stamp = datetime.now().strftime('%Y%m%dT%H%M%SZ')
-        uid = str(uuid.uuid4())
-        
-        # Clean string fields to prevent ICS breakage (newlines can break headers)
-        summary = data.get('summary', 'New Event').replace('\n', ' ')
-        description = data.get('description', '').replace('\n', '\\n')
-        location = data.get('location', '').replace('\n', ' ')
-
-        # Construct ICS
-        ics_content = f"""BEGIN:VCALENDAR
-VERSION:2.0
-PRODID:-//MyGmailAgent//EN
-BEGIN:VEVENT
-UID:{uid}
-DTSTAMP:{now_stamp}
-DTSTART;TZID=Local:{start_str}
-DTEND;TZID=Local:{end_str}
-SUMMARY:{summary}
-DESCRIPTION:{description}
-LOCATION:{location}
-STATUS:CONFIRMED
-END:VEVENT
-END:VCALENDAR"""
-        
-        return ics_content
+    def _to_event(self, data):
+        # Validated dicts are what gets cached, the typed event is built per use
+        return CalendarEvent.from_dict(data, default_time_zone=LOCAL_TIMEZONE)
@@ -0,0 +1,220 @@
+import random
+import threading
+import time
+from googleapiclient.errors import HttpError
+from src.ui.text_io import TextIO
+from src.utils.metrics import NullMetrics
+from src.config import (
+    API_RATE_LIMITS, API_QUOTA_UNITS, API_MAX_CONCURRENCY, API_MIN_CONCURRENCY,
+    API_MAX_RETRIES, API_BACKOFF_BASE, API_BACKOFF_MAX
+)
+
+# Statuses worth retrying: rate limited, or the server having a bad moment
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# 403s that mean "slow down" rather than "not allowed"
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+class _TokenBucket:
+    """Refills `rate` units per second, up to one second's worth."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cost):
+        """Blocks until `cost` units are available. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # A request bigger than the bucket goes once it's full, leaving it in debt
+                needed = min(cost, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= cost
+                    return waited
+                delay = (needed - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RequestScheduler:
+    """
+    Runs every Google API request of the run, shared by GmailClient and GCalClient.
+      - A token bucket per API (gmail, calendar) keeps us under the per-user rate,
+        weighted by each method's quota units (API_QUOTA_UNITS).
+      - 429s, 5xx and rate-limit 403s are retried with exponential backoff and
+        full jitter, waiting at least as long as Retry-After asks.
+      - How many requests may be in flight at once follows AIMD: +1 per window
+        of successes, halved whenever Google throttles us.
+    Failed items of a batch request are retried on their own.
+    """
+
+    def __init__(self, ui=None, metrics=None):
+        self.ui = ui or TextIO()
+        self.metrics = metrics or NullMetrics()
+        self._buckets = {api: _TokenBucket(rate) for api, rate in API_RATE_LIMITS.items()}
+
+        self._limit = float(API_MAX_CONCURRENCY)
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+        self.stats = {
+            "requests": 0,
+            "retries": 0,
+            "throttled": 0,  # Responses that told us to slow down
+            "throttle_seconds": 0.0,  # Waiting on the rate limit or backing off
+        }
+        self._stats_lock = threading.Lock()
+
+    @property
+    def concurrency(self):
+        return int(self._limit)
+
+    def execute(self, request, http=None):
+        """request.execute(http=http), scheduled and retried."""
+        return self._run(lambda: request.execute(http=http), self._method(request), self.cost(request))
+
+    def execute_batch(self, new_batch, requests, callback, http=None):
+        """
+        Sends (request_id, request) pairs as one batch. Items that fail with a
+        retryable error are sent again in a smaller batch after a backoff, so
+        callback(request_id, response, exception) sees each one exactly once,
+        with its final outcome.
+        """
+        requests = list(requests)
+        if not requests:
+            return
+
+        attempt = 0
+        while requests:
+            retry = {}
+            last_attempt = attempt >= API_MAX_RETRIES
+
+            def on_response(request_id, response, exception):
+                if exception is not None and not last_attempt and self._is_retryable(exception):
+                    retry[request_id] = exception
+                else:
+                    callback(request_id, response, exception)
+
+            batch = new_batch(callback=on_response)
+            for request_id, request in requests:
+                batch.add(request, request_id=request_id)
+
+            _, first = requests[0]
+            cost = sum(self.cost(request) for _, request in requests)
+            self._run(lambda: batch.execute(http=http), self._method(first) + ".batch", cost)
+
+            if not retry:
+                return
+
+            self._count("retries", len(retry))
+            throttled = [e for e in retry.values() if self._is_throttle(e)]
+            if throttled:
+                self._count("throttled", len(throttled))
+                self._decrease()
+
+            self._backoff(attempt, max((self._retry_after(e) for e in retry.values()), default=0.0))
+            requests = [(request_id, request) for request_id, request in requests if request_id in retry]
+            attempt += 1
+
+    def cost(self, request):
+        """Quota units of one request, by its method id (e.g. gmail.users.messages.get)."""
+        return API_QUOTA_UNITS.get(getattr(request, 'methodId', None), 1)
+
+    def _method(self, request):
+        return getattr(request, 'methodId', None) or 'unknown'
+
+    def _run(self, call, method, cost):
+        api = method.split('.', 1)[0]
+        attempt = 0
+        while True:
+            bucket = self._buckets.get(api)
+            if bucket:
+                waited = bucket.acquire(cost)
+                if waited:
+                    self._count("throttle_seconds", waited)
+
+            self._enter()
+            try:
+                self._count("requests", 1)
+                with self.metrics.timer("api_request_seconds", method=method):
+                    result = call()
+            except Exception as e:
+                if attempt >= API_MAX_RETRIES or not self._is_retryable(e):
+                    raise
+                error = e
+            else:
+                self._increase()
+                return result
+            finally:
+                self._leave()
+
+            self._count("retries", 1)
+            if self._is_throttle(error):
+                self._count("throttled", 1)
+                self._decrease()
+            self.ui.show_debug(f"Retrying {api} request after: {error}")
+            self._backoff(attempt, self._retry_after(error))
+            attempt += 1
+
+    def _backoff(self, attempt, retry_after):
+        delay = random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** attempt))
+        delay = max(delay, retry_after)
+        self._count("throttle_seconds", delay)
+        time.sleep(delay)
+
+    def _enter(self):
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def _leave(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _increase(self):
+        # Additive increase: about +1 after a full window of successful requests
+        with self._cond:
+            self._limit = min(API_MAX_CONCURRENCY, self._limit + 1 / self._limit)
+            self._cond.notify_all()
+
+    def _decrease(self):
+        # Multiplicative decrease
+        with self._cond:
+            self._limit = max(API_MIN_CONCURRENCY, self._limit / 2)
+
+    def _count(self, name, amount):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def _is_retryable(self, error):
+        if isinstance(error, HttpError):
+            return error.resp.status in RETRY_STATUSES or self._is_throttle(error)
+        return isinstance(error, (ConnectionError, TimeoutError))
+
+    def _is_throttle(self, error):
+        if not isinstance(error, HttpError):
+            return False
+        if error.resp.status == 429:
+            return True
+        if error.resp.status == 403:
+            content = error.content.decode('utf-8', 'replace') if isinstance(error.content, bytes) else str(error.content)
+            return any(reason in content for reason in RATE_LIMIT_REASONS)
+        return False
+
+    def _retry_after(self, error):
+        """Seconds the server asked us to wait, 0 if it didn't say (or sent a date)."""
+        if not isinstance(error, HttpError):
+            return 0.0
+        try:
+            return float(error.resp.get('retry-after', 0))
+        except (TypeError, ValueError):
+            return 0.0
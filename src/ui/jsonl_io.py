@@ -0,0 +1,48 @@
+import json
+import sys
+from src.ui.text_io import TextIO
+
+
+class JsonlIO(TextIO):
+    """
+    TextIO-compatible sink for headless runs.
+    Each processed email becomes one JSON line on `stream` (stdout by default);
+    records are buffered and written in chunks. Human-readable progress and
+    errors go to stderr so they never mix with the JSON output.
+    """
+
+    def __init__(self, stream=None, flush_every=50):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.flush_every = flush_every
+        self._buffer = []
+
+    def show_str(self, s):
+        print(s, file=sys.stderr)
+
+    # The per-email human output is replaced by record_email
+
+    def show_categorized_email(self, category, subject, rule=None):
+        pass
+
+    def show_event(self, ics_string):
+        pass
+
+    def show_cover(self):
+        pass
+
+    def record_email(self, record):
+        self._buffer.append(json.dumps(record, default=str))
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.stream.write('\n'.join(self._buffer) + '\n')
+            self.stream.flush()
+            self._buffer = []
+
+    def close(self):
+        self.flush()
+        if self.stream not in (sys.stdout, sys.stderr):
+            self.stream.close()
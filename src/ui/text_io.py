@@ -1,4 +1,5 @@
 from enum import IntEnum, auto
+from src.config import DEBUG_MODE
 
 # main
 
@@ -9,6 +10,16 @@ class Constants(IntEnum):
     GENERATING_EVENT = auto()
     EVENT_CREATED = auto()
     EVENT_ADDED = auto()
+    LLM_CACHE_STATS = auto()
+    LLM_TIMINGS = auto()
+    GMAIL_BYTES = auto()
+    CONDENSED = auto()
+    STARTUP_TIME = auto()
+    EVENT_DUPLICATE = auto()
+    EVENT_SKIPPED = auto()
+    EVENT_CONFLICTS = auto()
+    API_STATS = auto()
+    MESSAGE_STORE_STATS = auto()
 
 
 class TextIO:
@@ -20,6 +31,17 @@ class TextIO:
             "Generating Calendar Event...",
             "Event created successfully. Now adding events to your Google Calendar.",
             "Event added successfully.",
+            "LLM cache: {hits} hits, {misses} misses ({hit_rate:.0%} hit rate).",
+            "LLM: {calls} requests, {load_seconds:.1f}s loading the model, {inference_seconds:.1f}s inference.",
+            "Gmail: {megabytes:.2f} MB fetched.",
+            "  Condensed {tokens_before} -> {tokens_after} tokens ({tokens_saved} saved).",
+            "Startup: {seconds:.2f}s (sign-in {auth_seconds:.2f}s, API discovery {discovery_seconds:.2f}s).",
+            "Note: this looks like a duplicate of \"{summary}\" ({start}) already on your calendar.",
+            "Already on your calendar as \"{summary}\" ({start}), not added again.",
+            "Note: overlaps with {summaries}.",
+            "Google APIs: {requests} requests, {retries} retries ({throttled} throttled), "
+            "{throttle_seconds:.1f}s waiting on rate limits, concurrency {concurrency}.",
+            "Message store: {hits} found locally, {misses} fetched ({hit_rate:.0%}), {stored} stored.",
         ]
         
     # Display a string to the user
@@ -31,25 +53,41 @@ class TextIO:
         if 0 <= x < len(self.msg):
             self.show_str(self.msg[x])
         else:
-            print(f"Message index {x} not found")
+            self.show_str(f"Message index {x} not found")
 
     def show_formatted_msg(self, x, **kwargs):
         if 0 <= x < len(self.msg):
             self.show_str(self.msg[x].format(**kwargs))
         else:
-            print(f"Message index {x} not found")
+            self.show_str(f"Message index {x} not found")
 
-    def show_categorized_email(self, category, subject):
-        print(f"[{category}] {subject}")
+    def show_categorized_email(self, category, subject, rule=None):
+        if rule:
+            self.show_str(f"[{category}] {subject} (rule: {rule})")
+        else:
+            self.show_str(f"[{category}] {subject}")
     
     def show_event(self, ics_string):
-        print("-----BEGIN ICS EVENT-----")
-        print(ics_string)
-        print("-----END ICS EVENT-----")
+        self.show_str("-----BEGIN ICS EVENT-----")
+        self.show_str(ics_string)
+        self.show_str("-----END ICS EVENT-----")
 
 
     def show_error(self, error_msg):
-        print(f"Error: {error_msg}")
+        self.show_str(f"Error: {error_msg}")
+
+    def show_debug(self, s):
+        if DEBUG_MODE:
+            self.show_str(s)
+
+    # Machine-readable output. The human renderer already showed everything
+    # through the calls above, so these do nothing here (see JsonlIO).
+
+    def record_email(self, record):
+        pass
+
+    def close(self):
+        pass
 
 
 
@@ -62,5 +100,5 @@ class TextIO:
         |             Welcome                    |
         |----------------------------------------|
         """
-        print(cover_text)
+        self.show_str(cover_text)
     
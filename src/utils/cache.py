@@ -0,0 +1,128 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+
+class LLMCache:
+    """
+    Persistent, content-addressed cache for LLM results, stored in SQLite.
+
+    Entries are keyed by a hash of the normalized email text plus a per-task
+    fingerprint of everything that can change the answer (model name, prompt
+    template, schema). Editing a prompt or switching models therefore changes the
+    key, and entries written under an older fingerprint are purged the next time
+    the cache opens.
+
+    `fingerprints` maps each task name ('category', 'event', ...) to its fingerprint.
+    """
+
+    def __init__(self, path, fingerprints, max_entries=10000, max_age_days=30):
+        self.fingerprints = fingerprints
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+
+        # The pipeline calls us from several worker threads
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                task TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)"
+        )
+        self._invalidate_stale()
+        self.evict()
+
+    @staticmethod
+    def make_fingerprint(*parts):
+        """Hashes the model/prompt/schema pieces that results depend on."""
+        digest = hashlib.sha256()
+        for part in parts:
+            if not isinstance(part, str):
+                part = json.dumps(part, sort_keys=True)
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def make_key(self, task, text, *extra):
+        """Builds the cache key for `task` ('category', 'event', ...) on `text`."""
+        normalized = re.sub(r'\s+', ' ', text).strip().lower()
+        return self.make_fingerprint(self.fingerprints[task], task, normalized, *extra)
+
+    def get(self, key):
+        """Returns the cached value for key, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            now = time.time()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, task, key, value):
+        """Stores a JSON-serializable value under key."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, task, self.fingerprints[task], json.dumps(value), now, now)
+            )
+            self._conn.commit()
+
+    def evict(self):
+        """Drops expired entries, then the least recently used ones above max_entries."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.max_age,)
+            )
+            self._conn.execute(
+                """DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def stats(self):
+        """Hit/miss counters for this run."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _invalidate_stale(self):
+        """Removes entries written under a different model/prompt/schema."""
+        with self._lock:
+            for task, fingerprint in self.fingerprints.items():
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE task = ? AND fingerprint != ?",
+                    (task, fingerprint)
+                )
+            self._conn.commit()
@@ -0,0 +1,157 @@
+import re
+
+# Rough size of an English token. Good enough for budgeting without a tokenizer.
+CHARS_PER_TOKEN = 4
+
+# Where quoted reply history starts: everything from here on is an earlier message
+QUOTE_HEADERS = [
+    re.compile(r'^On\b.{0,200}\bwrote:\s*$', re.IGNORECASE),
+    re.compile(r'^-{2,}\s*Original Message\s*-{2,}', re.IGNORECASE),
+]
+# Outlook's separator above the quoted headers. In a forward it introduces the
+# forwarded message instead, so it only counts as a quote in replies.
+OUTLOOK_SEPARATOR = re.compile(r'^_{10,}\s*$')
+
+# A forwarded message is the content, not history: only its marker line goes
+FORWARD_MARKERS = re.compile(
+    r'^(-{2,}\s*Forwarded message\s*-{2,}|Begin forwarded message:)', re.IGNORECASE
+)
+FORWARD_SUBJECT = re.compile(r'^Subject:\s*(Fwd?|FW):', re.IGNORECASE)
+
+# Where the signature starts
+SIGNATURE_MARKERS = [
+    re.compile(r'^--\s*$'),
+    re.compile(r'^Sent from my \w+', re.IGNORECASE),
+    re.compile(r'^Get Outlook for \w+', re.IGNORECASE),
+]
+
+# Boilerplate lines, dropped from the trailing footer (see _strip_footer)
+BOILERPLATE = re.compile(
+    r'unsubscribe|view (this email )?in (your )?browser|manage (your )?(email )?preferences|'
+    r'all rights reserved|privacy policy|this (e-?mail|message) (was sent|is intended)|'
+    r'confidentiality notice|not the intended recipient|received this (e-?mail|message) in error',
+    re.IGNORECASE
+)
+# Lines this short (addresses, links, copyright) don't end the footer
+FOOTER_LINE_CHARS = 60
+
+
+def estimate_tokens(text):
+    """Tokenizer-free token estimate."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def fit_to_budget(text, token_budget):
+    """
+    Trims text to about token_budget tokens, cutting at a line or sentence
+    boundary instead of mid-word where possible.
+    """
+    max_chars = token_budget * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+
+    cut = text[:max_chars]
+    boundary = max(cut.rfind('\n'), cut.rfind('. '))
+    # Don't throw away more than a fifth of the budget just to end cleanly
+    if boundary > max_chars * 0.8:
+        cut = cut[:boundary + 1]
+    return cut.rstrip()
+
+
+class EmailCondenser:
+    """
+    Shrinks parsed email text before it is put into a prompt: drops quoted reply
+    history (forwarded messages are kept), signatures and boilerplate footers,
+    collapses duplicate lines and whitespace, then fits what is left to a token
+    budget.
+    """
+
+    def condense(self, text, token_budget):
+        """
+        Returns (condensed_text, stats) where stats has tokens_before, tokens_after
+        and tokens_saved.
+        """
+        tokens_before = estimate_tokens(text)
+
+        lines = self._strip_quoted_history(text.splitlines())
+        lines = self._strip_signature(lines)
+        lines = self._strip_footer(lines)
+
+        kept = []
+        seen = set()
+        for line in lines:
+            line = re.sub(r'\s+', ' ', line).strip()
+            if not line or line.startswith('>') or FORWARD_MARKERS.match(line):
+                continue
+            # Marketing mail repeats the same call to action over and over
+            key = line.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            kept.append(line)
+
+        condensed = fit_to_budget('\n'.join(kept), token_budget)
+        tokens_after = estimate_tokens(condensed)
+
+        return condensed, {
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "tokens_saved": tokens_before - tokens_after,
+        }
+
+    def _strip_quoted_history(self, lines):
+        # In a forward, header blocks introduce the forwarded message rather than
+        # quote an earlier one
+        forwarded = bool(lines) and FORWARD_SUBJECT.match(lines[0].strip()) or any(
+            FORWARD_MARKERS.match(line.strip()) for line in lines
+        )
+        for i, line in enumerate(lines):
+            stripped = line.strip()
+            if any(pattern.match(stripped) for pattern in QUOTE_HEADERS):
+                return lines[:i]
+            if forwarded:
+                continue
+            if OUTLOOK_SEPARATOR.match(stripped):
+                return lines[:i]
+            # Outlook-style "From: ... Sent: ..." header block of the previous message
+            if i > 1 and stripped.startswith('From:') and any(
+                following.strip().startswith(('Sent:', 'Date:')) for following in lines[i + 1:i + 4]
+            ):
+                return lines[:i]
+        return lines
+
+    def _strip_signature(self, lines):
+        for i, line in enumerate(lines):
+            if i > 0 and any(pattern.match(line.strip()) for pattern in SIGNATURE_MARKERS):
+                # A forward below the signature is still content: only the signature goes
+                for j in range(i + 1, len(lines)):
+                    if FORWARD_MARKERS.match(lines[j].strip()):
+                        return lines[:i] + self._strip_signature(lines[j:])
+                return lines[:i]
+        return lines
+
+    def _strip_footer(self, lines):
+        """
+        Drops the boilerplate lines of the trailing footer: the paragraphs at the
+        end of the email made only of boilerplate and short lines (addresses,
+        links, copyright), or those lines right after the last line of body text.
+        The same words in the body itself are left alone, and an email with no
+        body line above the footer (nor the Subject: line) is not touched.
+        """
+        # get_full_text puts the subject first; it is never part of the footer
+        first = 1 if lines and lines[0].startswith('Subject:') else 0
+        start = len(lines)
+        for i in range(len(lines) - 1, first - 1, -1):
+            line = lines[i].strip()
+            if not BOILERPLATE.search(line) and len(line) > FOOTER_LINE_CHARS:
+                if start == len(lines):
+                    # No paragraph break, the footer runs straight on from the body
+                    start = i + 1
+                break
+            if not line:
+                # Paragraph boundary: everything below it is footer
+                start = i
+        else:
+            # No body text above it, so there's no telling footer from body
+            start = len(lines)
+        return lines[:start] + [line for line in lines[start:] if not BOILERPLATE.search(line)]
@@ -0,0 +1,125 @@
+import hashlib
+import uuid
+from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+class CalendarEvent:
+    """
+    An event extracted from an email, in the form both OllamaClient and GCalClient
+    work with. ICS text is only produced when the event is shown or exported.
+
+    start/end are datetimes. time_zone is an IANA name (e.g. 'Europe/Paris') when
+    one is known; otherwise naive times are taken as the machine's local time.
+    """
+    __slots__ = ('summary', 'description', 'location', 'start', 'end', 'time_zone', 'uid')
+
+    def __init__(self, summary, start, end, description='', location='', time_zone=None, uid=None):
+        self.summary = summary
+        self.description = description
+        self.location = location
+        self.start = start
+        self.end = end
+        self.time_zone = time_zone
+        self.uid = uid
+
+    @classmethod
+    def from_dict(cls, data, default_time_zone=None):
+        """
+        Builds an event from the LLM's (already validated) JSON.
+        The model often fills timeZone with a placeholder like "User's Local
+        Timezone", so only values that look like real IANA names are kept.
+        """
+        time_zone = data['start'].get('timeZone') or ''
+        if '/' not in time_zone and time_zone != 'UTC':
+            time_zone = default_time_zone
+
+        return cls(
+            summary=data.get('summary') or 'New Event',
+            start=datetime.fromisoformat(data['start']['dateTime']),
+            end=datetime.fromisoformat(data['end']['dateTime']),
+            description=data.get('description', ''),
+            location=data.get('location', ''),
+            time_zone=time_zone
+        )
+
+    def make_uid(self, source_id):
+        """
+        A UID that only depends on the email the event came from and the event
+        itself, so extracting it again yields the same UID (and no duplicate).
+        """
+        key = '\x1f'.join([source_id, self.summary, self.start.isoformat(), self.end.isoformat()])
+        return f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}@gmail-agent"
+
+    def bounds(self):
+        """start and end as aware datetimes, comparable with any calendar's events."""
+        return self._aware(self.start), self._aware(self.end)
+
+    def _aware(self, dt):
+        if dt.tzinfo is not None:
+            return dt
+        if self.time_zone:
+            try:
+                return dt.replace(tzinfo=ZoneInfo(self.time_zone))
+            except (ZoneInfoNotFoundError, ValueError):
+                pass
+        return dt.astimezone()
+
+    def to_gcal_body(self):
+        """The event resource for the Google Calendar API."""
+        body = {
+            'summary': self.summary,
+            'description': self.description,
+            'location': self.location,
+            'start': self._gcal_time(self.start),
+            'end': self._gcal_time(self.end),
+        }
+        if self.uid:
+            body['iCalUID'] = self.uid
+        return body
+
+    def _gcal_time(self, dt):
+        if self.time_zone and dt.tzinfo is None:
+            return {'dateTime': dt.isoformat(), 'timeZone': self.time_zone}
+        # No zone name: send the UTC offset instead (naive means local time)
+        return {'dateTime': dt.astimezone().isoformat()}
+
+    def to_ics(self):
+        """Formats the event as an ICS calendar, for display or export."""
+        def to_ics_format(dt):
+            # Converts a datetime to ICS format (20231027T140000)
+            return dt.strftime('%Y%m%dT%H%M%S')
+
+        now_stamp = datetime.now().strftime('%Y%m%dT%H%M%SZ')
+        uid = self.uid or str(uuid.uuid4())
+
+        # Without a TZID the times are "floating", i.e. local wherever the file is opened
+        tz_param = f";TZID={self.time_zone}" if self.time_zone else ""
+        start, end = self._local(self.start), self._local(self.end)
+
+        # Clean string fields to prevent ICS breakage (newlines can break headers)
+        summary = self.summary.replace('\n', ' ')
+        description = self.description.replace('\n', '\\n')
+        location = self.location.replace('\n', ' ')
+
+        # Construct ICS
+        return f"""BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//MyGmailAgent//EN
+BEGIN:VEVENT
+UID:{uid}
+DTSTAMP:{now_stamp}
+DTSTART{tz_param}:{to_ics_format(start)}
+DTEND{tz_param}:{to_ics_format(end)}
+SUMMARY:{summary}
+DESCRIPTION:{description}
+LOCATION:{location}
+STATUS:CONFIRMED
+END:VEVENT
+END:VCALENDAR"""
+
+    def _local(self, dt):
+        # Aware times without a zone name are written as local wall-clock time
+        if dt.tzinfo is not None and not self.time_zone:
+            return dt.astimezone().replace(tzinfo=None)
+        return dt
@@ -0,0 +1,122 @@
+import random
+
+
+class _Node:
+    __slots__ = ('key', 'end', 'value', 'priority', 'left', 'right', 'max_end')
+
+    def __init__(self, key, end, value):
+        self.key = key  # (start, item_id)
+        self.end = end
+        self.value = value
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.max_end = end  # Latest end in this subtree
+
+
+class IntervalIndex:
+    """
+    Time intervals in a treap (a randomized balanced search tree) keyed by
+    (start, id), where every node also knows the latest end in its subtree.
+    Adding and removing take O(log n) expected. A query skips every subtree
+    whose intervals all end before it starts, so it costs O(log n) per result,
+    however long some of the intervals are.
+    Times are anything orderable, e.g. aware datetimes.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._starts = {}  # item_id -> start
+
+    def __len__(self):
+        return len(self._starts)
+
+    def add(self, item_id, start, end, value):
+        """Adds an interval, replacing any earlier one with the same id."""
+        self.remove(item_id)
+        self._root = self._insert(self._root, _Node((start, item_id), end, value))
+        self._starts[item_id] = start
+
+    def remove(self, item_id):
+        if item_id not in self._starts:
+            return
+        self._root = self._delete(self._root, (self._starts.pop(item_id), item_id))
+
+    def overlapping(self, start, end):
+        """Values of the intervals that overlap [start, end), by start time."""
+        found = []
+        self._collect(self._root, start, end, found)
+        return found
+
+    def _collect(self, node, start, end, found):
+        # Nothing in this subtree ends late enough (zero-length ones may end at `start`)
+        if node is None or node.max_end < start:
+            return
+
+        self._collect(node.left, start, end, found)
+        node_start = node.key[0]
+        if node_start >= end:
+            return  # ...and everything to the right starts later still
+        # Zero-length intervals (e.g. reminders) count when they fall inside
+        if node.end > start or (node_start == node.end and node_start >= start):
+            found.append(node.value)
+        self._collect(node.right, start, end, found)
+
+    def _insert(self, node, new):
+        if node is None:
+            return new
+        if new.priority > node.priority:
+            new.left, new.right = self._split(node, new.key)
+            self._update(new)
+            return new
+
+        if new.key < node.key:
+            node.left = self._insert(node.left, new)
+        else:
+            node.right = self._insert(node.right, new)
+        self._update(node)
+        return node
+
+    def _delete(self, node, key):
+        if node is None:
+            return None
+        if key < node.key:
+            node.left = self._delete(node.left, key)
+        elif node.key < key:
+            node.right = self._delete(node.right, key)
+        else:
+            return self._merge(node.left, node.right)
+        self._update(node)
+        return node
+
+    def _split(self, node, key):
+        """(subtree of keys below `key`, subtree of keys above it)"""
+        if node is None:
+            return None, None
+        if node.key < key:
+            node.right, right = self._split(node.right, key)
+            self._update(node)
+            return node, right
+        left, node.left = self._split(node.left, key)
+        self._update(node)
+        return left, node
+
+    def _merge(self, left, right):
+        """Joins two subtrees where every key in `left` is below those in `right`."""
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            self._update(left)
+            return left
+        right.left = self._merge(left, right.left)
+        self._update(right)
+        return right
+
+    def _update(self, node):
+        node.max_end = node.end
+        for child in (node.left, node.right):
+            if child is not None and child.max_end > node.max_end:
+                node.max_end = child.max_end
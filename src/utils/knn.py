@@ -0,0 +1,203 @@
+import argparse
+import hashlib
+import os
+import re
+import threading
+import zlib
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9'_-]+")
+
+
+class KNNClassifier:
+    """
+    Nearest-neighbour classifier that learns from the labels the LLM has already
+    given, so emails resembling earlier ones can skip the LLM entirely.
+
+    Texts become hashed bag-of-words vectors (L2-normalized, so a dot product is
+    cosine similarity) kept in a NumPy matrix that is persisted to an .npz file.
+    New labels are appended incrementally and written out by save(). Each text
+    is added once: a text already in the index (by content hash) is skipped.
+    """
+
+    def __init__(self, path, dim=4096, k=7):
+        self.path = path
+        self.dim = dim
+        self.k = k
+        self._lock = threading.Lock()
+
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.labels = np.array([], dtype=object)
+        self.keys = np.array([], dtype=object)
+        # Rows added since the last save/classify, merged lazily to avoid re-copying
+        self._new_vectors = []
+        self._new_labels = []
+        self._new_keys = []
+
+        if path and os.path.exists(path):
+            data = np.load(path, allow_pickle=False)
+            if data['vectors'].shape[1] == dim:
+                self.vectors = data['vectors'].astype(np.float32)
+                self.labels = data['labels'].astype(object)
+                # Indexes saved before keys were kept have none for their rows
+                self.keys = (
+                    data['keys'].astype(object) if 'keys' in data.files
+                    else np.array([''] * len(self.labels), dtype=object)
+                )
+        self._seen = set(self.keys) - {''}
+
+    def __len__(self):
+        return len(self.labels) + len(self._new_labels)
+
+    def vectorize(self, text):
+        """Hashed, log-scaled term frequencies of `text`, normalized to unit length."""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        tokens = TOKEN_RE.findall(text.lower())
+        if not tokens:
+            return vector
+
+        # crc32 instead of hash() so vectors stay stable across processes
+        buckets = np.fromiter(
+            (zlib.crc32(token.encode('utf-8')) % self.dim for token in tokens),
+            dtype=np.int64,
+            count=len(tokens)
+        )
+        np.add.at(vector, buckets, 1.0)
+        np.log1p(vector, out=vector)
+
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+    def classify(self, text):
+        """
+        Returns (label, confidence) for `text`, or (None, 0.0) if the index is empty.
+        Confidence is the similarity-weighted vote share of the winning label among
+        the k nearest neighbours, scaled by how close its nearest example is.
+        """
+        with self._lock:
+            self._merge()
+            if not len(self.labels):
+                return None, 0.0
+            similarities = self.vectors @ self.vectorize(text)
+            labels = self.labels
+
+        return self._vote(similarities, labels)
+
+    def add(self, text, label):
+        """
+        Appends a labelled example (e.g. the LLM's answer for this email).
+        Returns False, adding nothing, if this exact text is already in the index.
+        """
+        key = self.make_key(text)
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+
+        vector = self.vectorize(text)
+        with self._lock:
+            self._new_vectors.append(vector)
+            self._new_labels.append(label)
+            self._new_keys.append(key)
+        return True
+
+    def make_key(self, text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def save(self):
+        """Writes the index to disk."""
+        with self._lock:
+            self._merge()
+            np.savez_compressed(
+                self.path,
+                vectors=self.vectors,
+                labels=self.labels.astype(str),
+                keys=self.keys.astype(str)
+            )
+
+    def evaluate(self, thresholds=(0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9), chunk_size=512):
+        """
+        Leave-one-out evaluation against the stored LLM labels.
+        For each confidence threshold, returns how many emails would skip the LLM
+        (coverage) and how often the kNN answer agrees with the LLM for those.
+        """
+        with self._lock:
+            self._merge()
+            vectors = self.vectors
+            labels = self.labels
+
+        predictions = []
+        confidences = []
+        # Similarities are computed a chunk of rows at a time to bound memory
+        for start in range(0, len(labels), chunk_size):
+            block = vectors[start:start + chunk_size] @ vectors.T
+            for offset, similarities in enumerate(block):
+                similarities[start + offset] = -np.inf  # Leave the email itself out
+                label, confidence = self._vote(similarities, labels)
+                predictions.append(label)
+                confidences.append(confidence)
+
+        predictions = np.array(predictions, dtype=object)
+        confidences = np.array(confidences, dtype=np.float32)
+
+        report = []
+        for threshold in thresholds:
+            covered = confidences >= threshold
+            n_covered = int(covered.sum())
+            agreed = int((predictions[covered] == labels[covered]).sum())
+            report.append({
+                "threshold": threshold,
+                "coverage": n_covered / len(labels) if len(labels) else 0.0,
+                "agreement": agreed / n_covered if n_covered else 0.0,
+                "llm_calls_saved": n_covered,
+            })
+        return report
+
+    def _vote(self, similarities, labels):
+        k = min(self.k, len(labels))
+        if k == 0:
+            return None, 0.0
+
+        nearest = np.argpartition(-similarities, k - 1)[:k]
+        weights = np.clip(similarities[nearest], 0.0, None)
+        total = weights.sum()
+        if total <= 0:
+            return None, 0.0
+
+        scores = {}
+        for index, weight in zip(nearest, weights):
+            scores[labels[index]] = scores.get(labels[index], 0.0) + weight
+
+        label = max(scores, key=scores.get)
+        closest = max(w for i, w in zip(nearest, weights) if labels[i] == label)
+        return label, float(scores[label] / total * closest)
+
+    def _merge(self):
+        """Folds pending appends into the main matrix. Caller holds the lock."""
+        if self._new_labels:
+            self.vectors = np.vstack([self.vectors, np.stack(self._new_vectors)])
+            self.labels = np.concatenate([self.labels, np.array(self._new_labels, dtype=object)])
+            self.keys = np.concatenate([self.keys, np.array(self._new_keys, dtype=object)])
+            self._new_vectors = []
+            self._new_labels = []
+            self._new_keys = []
+
+
+if __name__ == "__main__":
+    from src.config import KNN_INDEX_PATH, KNN_DIM, KNN_K
+
+    parser = argparse.ArgumentParser(description="kNN email classifier tools")
+    parser.add_argument("command", choices=["evaluate"])
+    parser.add_argument("--index", default=str(KNN_INDEX_PATH))
+    args = parser.parse_args()
+
+    knn = KNNClassifier(args.index, dim=KNN_DIM, k=KNN_K)
+    print(f"Index: {args.index} ({len(knn)} labelled emails)")
+    print(f"{'threshold':>10} {'coverage':>10} {'agreement':>10} {'LLM calls saved':>16}")
+    for row in knn.evaluate():
+        print(
+            f"{row['threshold']:>10.2f} {row['coverage']:>10.1%} "
+            f"{row['agreement']:>10.1%} {row['llm_calls_saved']:>16}"
+        )
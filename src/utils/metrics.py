@@ -0,0 +1,196 @@
+import json
+import threading
+import time
+
+# Prefix of every exported metric name
+NAMESPACE = "gmail_agent"
+
+# HELP lines for the Prometheus export; metrics not listed here get none
+DESCRIPTIONS = {
+    "startup_seconds": "Seconds spent on each startup step.",
+    "stage_seconds": "Seconds each email spent in each pipeline stage.",
+    "email_seconds": "Seconds of stage work per email, all stages together.",
+    "emails": "Emails processed, by outcome.",
+    "api_request_seconds": "Seconds per Google API request, by method (a batch counts once).",
+    "llm_requests": "Ollama requests, by task.",
+    "llm_tokens": "Tokens Ollama read (prompt) and generated (output), by task.",
+    "llm_load_seconds": "Seconds Ollama spent loading the model, by task.",
+    "llm_total_seconds": "Seconds Ollama spent on requests in total, by task.",
+    "gmail_bytes_fetched": "Response bytes received from Gmail.",
+    "gmail_labelled": "Emails labelled as processed in Gmail, by category.",
+}
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _escape(value):
+    # Label values are quoted strings in the text format
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'labels', 'start')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Metrics:
+    """
+    Run telemetry: counters (add) and timings (observe / timer), each keyed by a
+    name plus labels, e.g. observe('stage_seconds', 0.2, stage='parse').
+    The summary can be written as JSON or in the Prometheus text format.
+    Use NullMetrics to turn it all off.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._timings.setdefault(key, []).append(seconds)
+
+    def timer(self, name, **labels):
+        """Context manager that observes how long its block took."""
+        return _Timer(self, name, labels)
+
+    def record_llm(self, response, task):
+        """Takes the counters Ollama reports with every response (durations are in ns)."""
+        self.add("llm_requests", task=task)
+        self.add("llm_tokens", response.get('prompt_eval_count') or 0, task=task, kind="prompt")
+        self.add("llm_tokens", response.get('eval_count') or 0, task=task, kind="output")
+        self.add("llm_load_seconds", (response.get('load_duration') or 0) / 1e9, task=task)
+        self.add("llm_total_seconds", (response.get('total_duration') or 0) / 1e9, task=task)
+
+    def summary(self):
+        """{'counters': {key: value}, 'timings': {key: {count, sum, max, p50, p95, p99}}}"""
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {key: sorted(values) for key, values in self._timings.items()}
+
+        return {
+            "counters": {self._format_key(key): value for key, value in counters.items()},
+            "timings": {
+                self._format_key(key): {
+                    "count": len(values),
+                    "sum": sum(values),
+                    "max": values[-1],
+                    **{f"p{int(q * 100)}": self._quantile(values, q) for q in QUANTILES},
+                }
+                for key, values in timings.items()
+            },
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_prometheus(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_prometheus())
+
+    def to_prometheus(self):
+        """The summary in the Prometheus text exposition format (counters and summaries)."""
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {key: sorted(values) for key, values in self._timings.items()}
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            metric = f"{NAMESPACE}_{name}_total"
+            self._header(lines, metric, name, "counter")
+            for (key_name, labels), value in sorted(counters.items()):
+                if key_name == name:
+                    lines.append(f"{metric}{self._labels(labels)} {value}")
+
+        for name in sorted({name for name, _ in timings}):
+            metric = f"{NAMESPACE}_{name}"
+            self._header(lines, metric, name, "summary")
+            for (key_name, labels), values in sorted(timings.items()):
+                if key_name != name:
+                    continue
+                for q in QUANTILES:
+                    quantile_labels = labels + (("quantile", str(q)),)
+                    lines.append(f"{metric}{self._labels(quantile_labels)} {self._quantile(values, q)}")
+                lines.append(f"{metric}_sum{self._labels(labels)} {sum(values)}")
+                lines.append(f"{metric}_count{self._labels(labels)} {len(values)}")
+
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines, metric, name, kind):
+        if name in DESCRIPTIONS:
+            lines.append(f"# HELP {metric} {DESCRIPTIONS[name]}")
+        lines.append(f"# TYPE {metric} {kind}")
+
+    def _labels(self, labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+    def _format_key(self, key):
+        name, labels = key
+        return name + self._labels(labels)
+
+    def _quantile(self, sorted_values, q):
+        # Nearest rank
+        index = min(len(sorted_values) - 1, max(0, int(q * len(sorted_values) + 0.5) - 1))
+        return sorted_values[index]
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullMetrics:
+    """Same interface as Metrics, doing nothing, for METRICS_ENABLED = False."""
+
+    def add(self, name, amount=1, **labels):
+        pass
+
+    def observe(self, name, seconds, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return _NULL_TIMER
+
+    def record_llm(self, response, task):
+        pass
+
+    def summary(self):
+        return {"counters": {}, "timings": {}}
+
+    def write_json(self, path):
+        pass
+
+    def write_prometheus(self, path):
+        pass
+
+    def to_prometheus(self):
+        return ""
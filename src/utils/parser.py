@@ -1,15 +1,85 @@
 from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 import re
 
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+# Elements that never have a closing tag, so they can't contain text
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+    'param', 'source', 'track', 'wbr'
+}
+
+
+class _TextExtractor(HTMLParser):
+    """
+    Single streaming pass over the HTML: text inside unwanted tags is dropped as
+    it goes by, everything else is collected, with no tree built at all.
+    """
+
+    def __init__(self, tags_to_remove):
+        super().__init__(convert_charrefs=True)
+        self.tags_to_remove = tags_to_remove
+        self.chunks = []
+        # Open elements, so a stray or missing end tag is handled like BeautifulSoup does
+        self._open = []
+        self._removed_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_ELEMENTS:
+            return
+        self._open.append(tag)
+        if tag in self.tags_to_remove:
+            self._removed_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        # <tag/> has no content, nothing to track
+        pass
+
+    def handle_endtag(self, tag):
+        if tag not in self._open:
+            return  # Stray end tag, ignored
+        while self._open:
+            closed = self._open.pop()
+            if closed in self.tags_to_remove:
+                self._removed_depth -= 1
+            if closed == tag:
+                break
+
+    def handle_data(self, data):
+        if self._removed_depth:
+            return
+        data = data.strip()
+        if data:
+            self.chunks.append(data)
+
+
 class EmailParser:
     """
     A robust utility to clean HTML emails into LLM-friendly plain text.
+
+    Backends:
+      - 'soup': BeautifulSoup tree, the original implementation.
+      - 'fast': single streaming pass with html.parser, same output on normal HTML.
+      - 'lxml': lxml's C parser when it is installed, otherwise 'fast'.
     """
-    
-    def __init__(self):
+
+    BACKENDS = ('soup', 'fast', 'lxml')
+
+    def __init__(self, backend='soup'):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown parser backend '{backend}', expected one of {self.BACKENDS}")
+        if backend == 'lxml' and lxml is None:
+            backend = 'fast'
+        self.backend = backend
+
         # Tags we definitely don't want the AI to read
         self.tags_to_remove = [
-            'script', 'style', 'meta', 'link', 'head', 'title', 
+            'script', 'style', 'meta', 'link', 'head', 'title',
             'iframe', 'svg', 'path', 'symbol', 'use', 'a'
         ]
 
@@ -20,6 +90,18 @@ class EmailParser:
         if not html_content:
             return ""
 
+        if self.backend == 'fast':
+            text = self._parse_fast(html_content)
+        elif self.backend == 'lxml':
+            text = self._parse_lxml(html_content)
+        else:
+            text = self._parse_soup(html_content)
+
+        text = re.sub(r'\n{3,}', '\n', text)
+
+        return text.strip()
+
+    def _parse_soup(self, html_content: str) -> str:
         # 1. Create the Soup
         soup = BeautifulSoup(html_content, 'html.parser')
 
@@ -28,8 +110,34 @@ class EmailParser:
             for element in soup.find_all(tag):
                 element.decompose()
 
-        text = soup.get_text(separator='\n', strip=True)
+        return soup.get_text(separator='\n', strip=True)
 
-        text = re.sub(r'\n{3,}', '\n', text)
-        
-        return text.strip()
\ No newline at end of file
+    def _parse_fast(self, html_content: str) -> str:
+        extractor = _TextExtractor(set(self.tags_to_remove))
+        extractor.feed(html_content)
+        extractor.close()
+        return '\n'.join(extractor.chunks)
+
+    def _parse_lxml(self, html_content: str) -> str:
+        try:
+            root = lxml.html.document_fromstring(html_content)
+        except (ValueError, etree.ParserError):
+            # e.g. an XML encoding declaration in a str, or nothing parseable
+            return self._parse_fast(html_content)
+
+        # Every text node is its own chunk, like get_text(separator='\n') gives,
+        # so the text on either side of a removed element isn't glued together
+        remove = set(self.tags_to_remove)
+        chunks = []
+        walk = etree.iterwalk(root, events=('start', 'end', 'comment', 'pi'))
+        for event, element in walk:
+            if event == 'start':
+                if element.tag in remove:
+                    walk.skip_subtree()  # Its 'end' still comes, for the tail
+                elif element.text:
+                    chunks.append(element.text)
+            elif element.tail:
+                chunks.append(element.tail)
+
+        chunks = (chunk.strip() for chunk in chunks)
+        return '\n'.join(chunk for chunk in chunks if chunk)
@@ -0,0 +1,190 @@
+import queue
+import threading
+import time
+
+# Marks the end of the stream as it travels down the queues
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a Pipeline: a function run by a pool of worker threads.
+    With batch_size > 1 the function receives a list of up to batch_size values
+    (whatever is already waiting in the queue) and must return a list of the same
+    length. An entry of that list may be an Exception to fail just that item.
+    """
+
+    def __init__(self, name, func, workers=1, batch_size=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+
+
+class PipelineItem:
+    """An item travelling through the pipeline, along with the first error it hit."""
+    __slots__ = ('seq', 'value', 'error', 'stage', 'timings')
+
+    def __init__(self, seq, value):
+        self.seq = seq
+        self.value = value
+        self.error = None
+        self.stage = None  # Name of the stage that failed, if any
+        self.timings = {}  # Seconds spent in each stage (a batch's time counts for all its items)
+
+
+class Pipeline:
+    """
+    Runs items through a chain of stages concurrently.
+    Every stage has its own worker pool and stages are connected by bounded queues,
+    so a slow stage applies backpressure upstream instead of letting work pile up.
+    Results are yielded in input order, so the caller can display them as if the
+    stages had run one after another.
+    """
+
+    def __init__(self, stages, queue_size=16, max_in_flight=None):
+        self.stages = stages
+        self.queue_size = queue_size
+        # Caps how many items can be between the source and the caller at once,
+        # including finished ones waiting behind a slow item for their turn.
+        self.max_in_flight = max_in_flight or queue_size * (len(stages) + 1)
+
+    def run(self, items):
+        """
+        Feeds `items` through the stages and yields a PipelineItem per input, in order.
+        Items that failed keep flowing (later stages skip them) so the order is kept.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        stop = threading.Event()
+        in_flight = threading.Semaphore(self.max_in_flight)
+        source_error = []
+
+        threads = [threading.Thread(
+            target=self._feed,
+            args=(items, queues[0], in_flight, stop, source_error),
+            daemon=True
+        )]
+
+        for i, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[i], queues[i + 1], remaining, lock, stop),
+                    daemon=True
+                ))
+
+        for thread in threads:
+            thread.start()
+
+        # Reorder buffer: finished items wait here until everything before them is out
+        pending = {}
+        next_seq = 0
+
+        try:
+            while True:
+                item = self._get(queues[-1], stop)
+                if item is _DONE:
+                    break
+
+                pending[item.seq] = item
+                while next_seq in pending:
+                    ready = pending.pop(next_seq)
+                    next_seq += 1
+                    in_flight.release()
+                    yield ready
+        finally:
+            stop.set()
+
+        if source_error:
+            raise source_error[0]
+
+    def _feed(self, items, out_queue, in_flight, stop, source_error):
+        try:
+            for seq, value in enumerate(items):
+                while not in_flight.acquire(timeout=0.5):
+                    if stop.is_set():
+                        return
+                if not self._put(out_queue, PipelineItem(seq, value), stop):
+                    return
+        except Exception as e:
+            # The source itself failed (e.g. listing the mailbox), surface it from run()
+            source_error.append(e)
+        self._put(out_queue, _DONE, stop)
+
+    def _work(self, stage, in_queue, out_queue, remaining, lock, stop):
+        while not stop.is_set():
+            item = self._get(in_queue, stop)
+            if item is _DONE:
+                break
+
+            batch = [item]
+            finished = False
+            # Take whatever else is already waiting, without holding up the first item
+            while len(batch) < stage.batch_size:
+                try:
+                    extra = in_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if extra is _DONE:
+                    finished = True
+                    break
+                batch.append(extra)
+
+            self._process(stage, batch)
+
+            for done_item in batch:
+                if not self._put(out_queue, done_item, stop):
+                    return
+
+            if finished:
+                break
+
+        # Let the sibling workers see the end of the stream too
+        self._put(in_queue, _DONE, stop)
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            self._put(out_queue, _DONE, stop)
+
+    def _process(self, stage, batch):
+        live = [item for item in batch if item.error is None]
+        if not live:
+            return
+
+        start = time.perf_counter()
+        try:
+            if stage.batch_size > 1:
+                results = stage.func([item.value for item in live])
+            else:
+                results = [stage.func(live[0].value)]
+        except Exception as e:
+            results = [e] * len(live)
+        elapsed = time.perf_counter() - start
+
+        for item, result in zip(live, results):
+            item.timings[stage.name] = elapsed
+            if isinstance(result, Exception):
+                item.error = result
+                item.stage = stage.name
+            else:
+                item.value = result
+
+    def _put(self, q, item, stop):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q, stop):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _DONE
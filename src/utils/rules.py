@@ -0,0 +1,119 @@
+import json
+import os
+import re
+from email.utils import parseaddr
+
+# Used when there is no rules file. Kept conservative on purpose: anything these
+# don't catch still goes to the LLM.
+DEFAULT_RULES = {
+    "allow_senders": [],
+    "deny_senders": [],
+    "rules": [
+        {
+            "name": "gmail-promotions",
+            "category": "Unimportant",
+            "labels_any": ["CATEGORY_PROMOTIONS"]
+        },
+        {
+            "name": "gmail-social",
+            "category": "Unimportant",
+            "labels_any": ["CATEGORY_SOCIAL"]
+        },
+        {
+            "name": "bulk-precedence",
+            "category": "Unimportant",
+            "header_matches": {"Precedence": "^(bulk|junk)$"}
+        }
+    ]
+}
+
+
+class RuleClassifier:
+    """
+    Cheap pre-classifier that settles obvious emails from their headers and labels,
+    so only the ones that fall through need an LLM call.
+
+    The rules file is JSON:
+        {
+          "allow_senders": ["boss@work.com", "@university.edu"],  # always go to the LLM
+          "deny_senders": ["@spammy.com"],                          # always Unimportant
+          "rules": [
+            {
+              "name": "newsletters",
+              "category": "Unimportant",
+              "header_present": ["List-Unsubscribe"],               # all must be present
+              "header_matches": {"Precedence": "^bulk$"},           # regex, case-insensitive
+              "labels_any": ["CATEGORY_PROMOTIONS"],                # any of these Gmail labels
+              "senders": ["@news.example.com"]                      # address or @domain
+            }
+          ]
+        }
+    Every condition given in a rule must hold; the first matching rule wins.
+    """
+
+    def __init__(self, rules_path=None):
+        config = DEFAULT_RULES
+        if rules_path and os.path.exists(rules_path):
+            with open(rules_path, 'r') as f:
+                config = json.load(f)
+
+        self.allow_senders = [s.lower() for s in config.get('allow_senders', [])]
+        self.deny_senders = [s.lower() for s in config.get('deny_senders', [])]
+        self.rules = config.get('rules', [])
+
+    def header_names(self):
+        """The headers the rules look at, for fetches that only ask for some."""
+        names = {}
+        for rule in self.rules:
+            for name in [*rule.get('header_present', []), *rule.get('header_matches', {})]:
+                names.setdefault(name.lower(), name)
+        return list(names.values())
+
+    def classify(self, details):
+        """
+        Returns (category, rule_name) for an email dict from GmailClient, or
+        (None, rule_name or None) if it should go to the LLM.
+        """
+        sender = parseaddr(details.get('sender', ''))[1].lower()
+
+        if self._sender_in(sender, self.allow_senders):
+            return None, "allow_senders"
+        if self._sender_in(sender, self.deny_senders):
+            return "Unimportant", "deny_senders"
+
+        headers = details.get('headers', {})
+        labels = set(details.get('labels', []))
+
+        for rule in self.rules:
+            if self._matches(rule, sender, headers, labels):
+                return rule.get('category'), rule.get('name')
+
+        return None, None
+
+    def _matches(self, rule, sender, headers, labels):
+        for name in rule.get('header_present', []):
+            if name.lower() not in headers:
+                return False
+
+        for name, pattern in rule.get('header_matches', {}).items():
+            value = headers.get(name.lower())
+            if value is None or not re.search(pattern, value.strip(), re.IGNORECASE):
+                return False
+
+        if 'labels_any' in rule and not labels.intersection(rule['labels_any']):
+            return False
+
+        if 'senders' in rule and not self._sender_in(sender, [s.lower() for s in rule['senders']]):
+            return False
+
+        return True
+
+    def _sender_in(self, sender, patterns):
+        """Matches an address against exact addresses and '@domain' entries."""
+        for pattern in patterns:
+            if pattern.startswith('@'):
+                if sender.endswith(pattern):
+                    return True
+            elif sender == pattern:
+                return True
+        return False
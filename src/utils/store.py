@@ -0,0 +1,249 @@
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# How far processing of a stored message got
+STATES = (
+    'fetched',  # Failed before it was classified
+    'classified',  # Classified, then failed in a later stage
+    'event_failed',  # An Event whose event didn't make it to the calendar
+    'done',
+)
+
+# Columns a stored message comes back with (besides its rowid)
+COLUMNS = (
+    'id', 'sender', 'subject', 'date', 'received_at', 'headers', 'labels', 'text',
+    'category', 'rule', 'event_link', 'state', 'attempts', 'updated_at'
+)
+
+
+class MessageStore:
+    """
+    Local copy of the emails we have processed, in SQLite, keyed by Gmail id:
+    headers, labels, the parsed text (what get_full_text returns, not the raw
+    HTML), the classification, how far processing got (see STATES) and how many
+    runs in a row have left it unfinished (attempts).
+
+    The pipeline looks messages up here before fetching them from Gmail, and
+    the text is indexed with FTS5 so the store can be searched locally (see
+    search() and `python -m src.utils.store`). The database is in WAL mode, so
+    other processes can read it while a run is writing. Messages not updated
+    for retention_days are dropped when the store opens.
+    """
+
+    def __init__(self, path, retention_days=90):
+        self.retention = retention_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+
+        # The pipeline calls us from several worker threads
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # Only takes effect on a new database; lets prune() hand space back
+        self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS messages (
+                id TEXT PRIMARY KEY,
+                sender TEXT,
+                subject TEXT,
+                date TEXT,
+                received_at REAL,
+                headers TEXT,
+                labels TEXT,
+                text TEXT,
+                category TEXT,
+                rule TEXT,
+                event_link TEXT,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_category ON messages (category, received_at);
+            CREATE INDEX IF NOT EXISTS messages_updated ON messages (updated_at);
+
+            -- External-content index: the text lives only once, in messages
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                subject, sender, text, content='messages', content_rowid='rowid'
+            );
+            CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts (rowid, subject, sender, text)
+                VALUES (new.rowid, new.subject, new.sender, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, subject, sender, text)
+                VALUES ('delete', old.rowid, old.subject, old.sender, old.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, subject, sender, text)
+                VALUES ('delete', old.rowid, old.subject, old.sender, old.text);
+                INSERT INTO messages_fts (rowid, subject, sender, text)
+                VALUES (new.rowid, new.subject, new.sender, new.text);
+            END;"""
+        )
+        # Stores created before there was an attempts column
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(messages)")}
+        if 'attempts' not in columns:
+            self._conn.execute("ALTER TABLE messages ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            self._conn.commit()
+        self.prune()
+
+    def get_many(self, message_ids):
+        """Returns {id: email dict} for the ids that are stored (see _to_email)."""
+        if not message_ids:
+            return {}
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM messages WHERE id IN ({','.join('?' * len(message_ids))})",
+                list(message_ids)
+            ).fetchall()
+            self.hits += len(rows)
+            self.misses += len(message_ids) - len(rows)
+
+        return {row['id']: self._to_email(row) for row in rows}
+
+    def save(self, details, state='done'):
+        """
+        Stores (or updates) an email dict from the pipeline, `state` being one of
+        STATES. Returns its attempts: how many saves in a row (one per run) left it
+        in a state other than 'done', this one included.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO messages (
+                    id, sender, subject, date, received_at, headers, labels, text,
+                    category, rule, event_link, state, attempts, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    labels = excluded.labels,
+                    text = COALESCE(excluded.text, messages.text),
+                    category = excluded.category,
+                    rule = excluded.rule,
+                    event_link = COALESCE(excluded.event_link, messages.event_link),
+                    state = excluded.state,
+                    attempts = CASE WHEN excluded.state = 'done' THEN 0 ELSE messages.attempts + 1 END,
+                    updated_at = excluded.updated_at""",
+                (
+                    details['id'], details.get('sender'), details.get('subject'), details.get('date'),
+                    self._received_at(details.get('date'), now),
+                    json.dumps(details.get('headers') or {}), json.dumps(details.get('labels') or []),
+                    details.get('text'), details.get('category'), details.get('rule'),
+                    details.get('event_link'), state, int(state != 'done'), now
+                )
+            )
+            self._conn.commit()
+            return self._conn.execute(
+                "SELECT attempts FROM messages WHERE id = ?", (details['id'],)
+            ).fetchone()[0]
+
+    def search(self, query=None, category=None, sender=None, days=None, state=None, limit=50):
+        """
+        Stored emails, newest first. `query` is an FTS5 match on subject, sender
+        and text (e.g. 'hackathon OR "career fair"'); `sender` is a substring;
+        `days` keeps emails received in the last that many days.
+        """
+        sql = "SELECT messages.* FROM messages"
+        conditions = []
+        params = []
+
+        if query:
+            sql += " JOIN messages_fts ON messages_fts.rowid = messages.rowid"
+            conditions.append("messages_fts MATCH ?")
+            params.append(query)
+        # messages_fts has subject and sender columns too, so qualify everything
+        if category:
+            conditions.append("messages.category = ?")
+            params.append(category)
+        if sender:
+            conditions.append("messages.sender LIKE ?")
+            params.append(f"%{sender}%")
+        if days is not None:
+            conditions.append("messages.received_at >= ?")
+            params.append(time.time() - days * 24 * 3600)
+        if state:
+            conditions.append("messages.state = ?")
+            params.append(state)
+
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY messages.received_at DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._to_email(row) for row in rows]
+
+    def prune(self):
+        """Drops messages past retention and gives the freed pages back to the filesystem."""
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM messages WHERE updated_at < ?", (time.time() - self.retention,)
+            ).rowcount
+            self._conn.commit()
+            if deleted:
+                # Merge the FTS index segments and release free pages
+                self._conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+                self._conn.commit()
+                self._conn.execute("PRAGMA incremental_vacuum")
+
+    def stats(self):
+        """Lookup counters for this run, plus how many messages are stored."""
+        with self._lock:
+            stored = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "stored": stored,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _to_email(self, row):
+        """A stored row in the same shape as GmailClient's email dicts ('body' is None)."""
+        email = {column: row[column] for column in COLUMNS}
+        email['headers'] = json.loads(email['headers'] or '{}')
+        email['labels'] = json.loads(email['labels'] or '[]')
+        email['body'] = None
+        return email
+
+    def _received_at(self, date_header, default):
+        try:
+            return parsedate_to_datetime(date_header).timestamp()
+        except (TypeError, ValueError, IndexError):
+            return default
+
+
+if __name__ == "__main__":
+    from src.config import MESSAGE_STORE_PATH, MESSAGE_STORE_RETENTION_DAYS
+
+    parser = argparse.ArgumentParser(description="Local message store tools")
+    parser.add_argument("command", choices=["search", "stats"])
+    parser.add_argument("query", nargs="?", help="FTS5 query on subject, sender and text")
+    parser.add_argument("--category", help="e.g. Opportunity")
+    parser.add_argument("--sender", help="Substring of the From header")
+    parser.add_argument("--days", type=float, help="Only emails received in the last N days")
+    parser.add_argument("--state", choices=STATES, help="e.g. event_failed")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--store", default=str(MESSAGE_STORE_PATH))
+    args = parser.parse_args()
+
+    # Opening the store also applies retention
+    store = MessageStore(args.store, retention_days=MESSAGE_STORE_RETENTION_DAYS)
+    if args.command == "stats":
+        print(f"Store: {args.store} ({store.stats()['stored']} messages)")
+    else:
+        for email in store.search(args.query, args.category, args.sender, args.days, args.state, args.limit):
+            print(f"{email['date'] or '':<32} {email['category'] or '-':<12} {email['state']:<13} {email['sender']}")
+            print(f"{'':<32} {'':<12} {'':<13} {email['subject']}")
+    store.close()
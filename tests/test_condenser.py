@@ -0,0 +1,70 @@
+from src.utils.condenser import EmailCondenser
+
+
+def condense(text):
+    return EmailCondenser().condense(text, 10_000)[0]
+
+
+def test_ios_forward_keeps_forwarded_body():
+    text = (
+        "Subject: Fwd: Team offsite\n"
+        "FYI\n"
+        "\n"
+        "Sent from my iPhone\n"
+        "\n"
+        "Begin forwarded message:\n"
+        "\n"
+        "From: Dana <dana@example.com>\n"
+        "Date: March 1, 2026\n"
+        "Subject: Team offsite\n"
+        "\n"
+        "The offsite is on March 12 at 9am in the Harbor room.\n"
+    )
+    condensed = condense(text)
+    assert "Sent from my iPhone" not in condensed
+    assert "The offsite is on March 12 at 9am in the Harbor room." in condensed
+
+
+def test_gmail_forward_keeps_forwarded_body():
+    text = (
+        "Subject: Fwd: Dentist\n"
+        "See below\n"
+        "-- \n"
+        "Sam\n"
+        "\n"
+        "---------- Forwarded message ---------\n"
+        "From: Clinic <front@clinic.example>\n"
+        "Date: Mon, Mar 2, 2026\n"
+        "Subject: Dentist\n"
+        "\n"
+        "Your appointment is confirmed for March 20 at 3pm.\n"
+        "-- \n"
+        "Clinic front desk\n"
+    )
+    condensed = condense(text)
+    assert "Your appointment is confirmed for March 20 at 3pm." in condensed
+    assert "Sam" not in condensed.splitlines()
+    assert "Clinic front desk" not in condensed
+
+
+def test_short_email_is_not_treated_as_footer():
+    text = (
+        "Subject: Unsubscribe me from the privacy policy list\n"
+        "Please unsubscribe me.\n"
+        "Thanks\n"
+    )
+    assert condense(text) == text.strip()
+
+
+def test_footer_after_body_is_dropped():
+    text = (
+        "Subject: Spring sale\n"
+        "Our spring sale runs from April 1 to April 7 with up to half off every jacket.\n"
+        "\n"
+        "Unsubscribe | Privacy policy\n"
+        "(c) 2026 Example Co\n"
+    )
+    condensed = condense(text)
+    assert "spring sale runs" in condensed
+    assert "Unsubscribe" not in condensed
+    assert "Subject: Spring sale" in condensed